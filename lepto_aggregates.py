@@ -0,0 +1,212 @@
+"""Precomputed per-city aggregates for the City Insights page and the EDA.
+
+Everything the page shows for a city (yearly totals, average monthly cases,
+weeks with/without cases and the risk-factor overlays) is computed for all
+cities in one grouped pass, so selecting a city is a dictionary lookup.
+
+The seasonal baseline holds, per city and ISO week, the count, mean, spread
+and quantiles of the cases and climate values over all years. Asking whether
+a week is unusual is then a lookup on (city, week); appended weeks only
+recompute the cells they fall into.
+
+The EDA's case summary tables (total, yearly and monthly cases per city and
+the top-3 years/months) likewise come from a single grouped pass, held in
+memory and written to CSV only on request.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from lepto_data import DATA_PATH, CLIMATE_COLUMNS, derived, widen_float32
+
+# Features offered in the "Leptospirosis Risk Factors" dropdown
+OVERLAY_FEATURES = ['heat_index', 'rh', 'pr']
+
+# File names of the persisted case summary tables (as written by the EDA notebook)
+CASE_SUMMARY_FILES = {
+    'total': 'total_cases_per_city.csv',
+    'yearly': 'cases_per_city_per_year.csv',
+    'monthly': 'cases_per_city_per_month.csv',
+    'top3_years': 'top_3_years_summary.csv',
+    'top3_months': 'top_3_months_summary.csv',
+}
+
+# Columns and quantiles of the seasonal baseline
+BASELINE_COLUMNS = ['case_total'] + CLIMATE_COLUMNS
+BASELINE_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.95]
+BASELINE_STATS = ['count', 'mean', 'std'] + [f'q{round(q * 100)}' for q in BASELINE_QUANTILES]
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def min_max_scale(values):
+    # Same result as sklearn's MinMaxScaler on one column (constant columns scale to 0)
+    values = np.asarray(values, dtype='float64')
+    value_range = values.max() - values.min()
+    return (values - values.min()) / (value_range if value_range != 0 else 1.0)
+
+
+def build_city_cube(lepto_df, features=OVERLAY_FEATURES):
+    features = list(features)
+
+    # Total cases per city per year
+    yearly = lepto_df.groupby(['adm3_en', 'year'], observed=True)['case_total'].sum().reset_index()
+
+    # Monthly case sums and feature means per year, then averaged across years
+    monthly_data = lepto_df.groupby(['adm3_en', 'year', 'month'], observed=True).agg(
+        {'case_total': 'sum', **{feature: 'mean' for feature in features}}
+    ).reset_index()
+    monthly_avg = monthly_data.groupby(['adm3_en', 'month'], observed=True)[['case_total'] + features].mean().reset_index()
+
+    # Weeks with and without cases, without a Python-level apply
+    weekly_counts = lepto_df.assign(with_case=lepto_df['case_total'] > 0).groupby('adm3_en', observed=True)['with_case'].agg(['sum', 'count'])
+
+    yearly_by_city = dict(tuple(yearly.groupby('adm3_en', observed=True)))
+    monthly_by_city = dict(tuple(monthly_avg.groupby('adm3_en', observed=True)))
+
+    cube = {}
+    for city, city_yearly in yearly_by_city.items():
+        city_yearly = city_yearly[['year', 'case_total']].reset_index(drop=True)
+        city_monthly = monthly_by_city[city].drop(columns='adm3_en').reset_index(drop=True)
+
+        # Year with the maximum number of cases
+        max_year = city_yearly.loc[city_yearly['case_total'].idxmax(), 'year']
+        max_cases = city_yearly['case_total'].max()
+
+        # Top 3 months with the highest average cases
+        top_months = city_monthly[['month', 'case_total']].sort_values(by='case_total', ascending=False).head(3)
+        top_month_names = [MONTH_NAMES[int(month) - 1] for month in top_months['month']]
+
+        with_case_count = int(weekly_counts.loc[city, 'sum'])
+        without_case_count = int(weekly_counts.loc[city, 'count']) - with_case_count
+
+        cube[city] = {
+            'yearly': city_yearly,
+            'max_year': max_year,
+            'max_cases': max_cases,
+            'monthly_avg': city_monthly,
+            'top_months': top_months,
+            'peak_cases': city_monthly['case_total'].max(),
+            'top_months_str': ", ".join(top_month_names[:-1]) + ", and " + top_month_names[-1],
+            'with_case_count': with_case_count,
+            'without_case_count': without_case_count,
+        }
+    return cube
+
+
+def update_city_cube(city_cube, lepto_df, new_rows, features=OVERLAY_FEATURES):
+    # Cube after rows were appended: only the cities that received rows are recomputed
+    cities = pd.unique(new_rows['adm3_en'].astype(str))
+    return {**city_cube, **build_city_cube(lepto_df[lepto_df['adm3_en'].isin(cities)], features)}
+
+
+def load_city_cube(path=DATA_PATH):
+    # Cube for the currently cached dataset; rebuilt only when the dataset is re-parsed
+    # and updated city by city when rows are appended
+    return derived(path, 'city_cube', build_city_cube, update_city_cube)
+
+
+def top_periods(table, label, n=3):
+    # Top-n periods (rows) of each city (column) with their sums and share of the
+    # city's total; ties keep the earlier period, as Series.nlargest does
+    values = table.to_numpy(dtype='float64')
+    order = np.argsort(-np.nan_to_num(values, nan=-np.inf), axis=0, kind='stable')[:n]
+    top_values = np.take_along_axis(values, order, axis=0)
+    top_periods = table.index.to_numpy()[order]
+    top_sums = np.nansum(top_values, axis=0)
+    totals = np.nansum(values, axis=0)
+    shares = np.divide(top_sums * 100, totals, out=np.zeros_like(top_sums), where=totals > 0)
+
+    summary = pd.DataFrame({
+        'City': table.columns,
+        f'Top {n} {label}': [', '.join(str(period) for period in periods) for periods in top_periods.T],
+        f'Top {n} Sums': [', '.join(f'{value:.2f}' for value in city_values) for city_values in top_values.T],
+        f'Sum of Top {n} {label}': top_sums.round(2),
+        f'Percentage of Top {n} {label}': [f'{share:.2f}%' for share in shares],
+    })
+    return summary.sort_values(f'Sum of Top {n} {label}', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def build_case_summaries(lepto_df):
+    # Case summary tables for all cities from one grouped pass over the weekly rows:
+    #   total       - cases per city (Series)
+    #   yearly      - year x city case sums
+    #   monthly     - month (Period) x city case sums
+    #   top3_years  - each city's three worst years
+    #   top3_months - each city's three worst calendar months, summed over the years
+    dates = pd.to_datetime(lepto_df['date'])
+    monthly = lepto_df['case_total'].groupby(
+        [dates.dt.to_period('M').rename('date'), lepto_df['adm3_en'].astype(str)]
+    ).sum().unstack()
+
+    # Everything else is rolled up from the (small) month x city table
+    yearly = monthly.groupby(monthly.index.year.astype('int32').rename('date')).sum(min_count=1)
+    month_of_year = monthly.groupby(monthly.index.month.astype('int32').rename('month')).sum(min_count=1)
+    total = monthly.sum().rename('case_total')
+    return {
+        'total': total,
+        'yearly': yearly,
+        'monthly': monthly,
+        'top3_years': top_periods(yearly, 'Years'),
+        'top3_months': top_periods(month_of_year, 'Months'),
+    }
+
+
+def save_case_summaries(summaries, out_dir):
+    # Write the tables under the EDA notebook's file names
+    os.makedirs(out_dir, exist_ok=True)
+    for name, file_name in CASE_SUMMARY_FILES.items():
+        index = not name.startswith('top3_')
+        summaries[name].to_csv(os.path.join(out_dir, file_name), index=index)
+
+
+def load_case_summaries(path=DATA_PATH):
+    # Case summaries of the currently cached dataset, shared by every caller in the process
+    return derived(path, 'case_summaries', build_case_summaries)
+
+
+def _baseline_keys(lepto_df):
+    # (city, ISO week) of each row; the cached dataset already carries the week
+    weeks = lepto_df['week'] if 'week' in lepto_df.columns else pd.to_datetime(lepto_df['date']).dt.isocalendar().week
+    return [lepto_df['adm3_en'].astype(str).rename('adm3_en'), weeks.astype('int64').rename('week')]
+
+
+def build_seasonal_baseline(lepto_df, columns=BASELINE_COLUMNS):
+    # (city, ISO week) x '<column>_<stat>' table over all years of data, computed in float64.
+    # Compact float32 columns are widened through their decimal repr, so no widening noise enters the stats.
+    values = pd.DataFrame({
+        col: widen_float32(lepto_df[col]) if lepto_df[col].dtype == 'float32' else lepto_df[col].to_numpy(dtype='float64')
+        for col in columns
+    }, index=lepto_df.index)
+    grouped = values.groupby(_baseline_keys(lepto_df))
+    moments = grouped.agg(['count', 'mean', 'std'])
+    quantiles = grouped.quantile(BASELINE_QUANTILES).unstack()
+    table = pd.concat([moments, quantiles.rename(columns=lambda q: f'q{round(q * 100)}', level=1)], axis=1)
+    table.columns = [f'{col}_{stat}' for col, stat in table.columns]
+    return table[[f'{col}_{stat}' for col in columns for stat in BASELINE_STATS]]
+
+
+def touched_cells(lepto_df, new_rows):
+    # Mask of the rows of lepto_df in the (city, ISO week) cells that `new_rows` fall into
+    touched = pd.MultiIndex.from_arrays(_baseline_keys(new_rows)).unique()
+    return pd.MultiIndex.from_arrays(_baseline_keys(lepto_df)).isin(touched)
+
+
+def update_seasonal_baseline(baseline, lepto_df, new_rows, columns=BASELINE_COLUMNS):
+    # Baseline after rows were appended: only the (city, week) cells that received rows are recomputed
+    updated = build_seasonal_baseline(lepto_df[touched_cells(lepto_df, new_rows)], columns)
+    return pd.concat([baseline.drop(updated.index, errors='ignore'), updated]).sort_index()
+
+
+def load_seasonal_baseline(path=DATA_PATH):
+    # Baseline of the currently cached dataset, updated cell by cell when rows are appended
+    return derived(path, 'seasonal_baseline', build_seasonal_baseline, update_seasonal_baseline)
+
+
+def lookup_baseline(baseline, rows):
+    # Baseline entries for each row's city and ISO week, aligned with `rows` (NaN for unseen cells)
+    found = baseline.reindex(pd.MultiIndex.from_arrays(_baseline_keys(rows)))
+    found.index = rows.index
+    return found
@@ -0,0 +1,315 @@
+"""Early-warning alerts against the seasonal baseline.
+
+    python lepto_alerts.py                        # latest week in the data
+    python lepto_alerts.py --week 2019-08-05 --top 5
+    python lepto_alerts.py --batch new_week.csv   # score a batch without ingesting it
+
+Every city-week is compared with the city's baseline for its ISO week
+(the cached lepto_aggregates.load_seasonal_baseline table):
+
+  - z-scores of case_total and pr against the week's mean and std
+  - exceedance of the week's upper quantile (ALERT_QUANTILE)
+  - upper CUSUM of the z-scores, which builds up over consecutive weeks
+    of moderate excess that no single week would flag
+  - flood-weighted excess rainfall: rainfall above the week's median times
+    the city's flood exposure (its 5-year flood hazard area, weighted by level)
+
+A case signal raises an 'alert'. A rainfall signal raises a 'watch' in
+cities with flood-prone area, because cases follow heavy rain by 1-4 weeks.
+Alerts are ranked by level, then by score: the case z-score or CUSUM (in
+units of its threshold) for alerts, and the flood-weighted rainfall for
+watches.
+
+A batch is scored for all cities in one vectorized call. The CUSUM carries
+over between weeks through a per-city state. For the stored history the
+state comes from a closed form (cumulative sum minus its running minimum),
+so no loop over the weeks is needed. A stored week is scored against its
+baseline cell with the week itself left out. load_alert_history() keeps the
+scores, the CUSUM state and each city's latest alerts with the cached dataset.
+When weeks are appended, only the rows of the baseline cells they fall into
+are rescored and the CUSUM is rerun for their cities, so the history always
+equals a full rebuild. lepto_ingest runs the detector on every accepted batch
+from that cached state.
+"""
+
+import sys
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from lepto_data import DATA_PATH, WeeklyPanel, derived, load_lepto_dataset
+from lepto_aggregates import BASELINE_STATS, load_seasonal_baseline, lookup_baseline, touched_cells
+
+# Series scored against the baseline, with the name used in the output columns
+ALERT_COLUMNS = {'case_total': 'cases', 'pr': 'pr'}
+
+Z_THRESHOLD = 2.0
+ALERT_QUANTILE = 'q90'
+
+# Upper CUSUM on the z-scores: slack subtracted each week, cap on a single week's z-score
+# (so one outbreak week does not keep the sum up for months) and the decision threshold
+CUSUM_SLACK = 1.0
+CUSUM_CAP = 3.0
+CUSUM_THRESHOLD = 5.0
+
+# Floors on the baseline std, so weeks whose history is all zeros do not give infinite z-scores
+MIN_STD = {'case_total': 1.0, 'pr': 1.0}
+
+# Share of a 5-year flood hazard level's area counted towards the city's flood exposure
+FLOOD_EXPOSURE_WEIGHTS = {
+    'pct_area_flood_hazard_5yr_low': 1 / 3,
+    'pct_area_flood_hazard_5yr_med': 2 / 3,
+    'pct_area_flood_hazard_5yr_high': 1.0,
+}
+
+LEVELS = ['alert', 'watch']
+
+CUSUM_COLUMNS = [f'{name}_cusum' for name in ALERT_COLUMNS.values()]
+
+
+def flood_exposure(hazards):
+    # Level-weighted share (0-1) of each city's area in 5-year flood hazard zones; `hazards` is indexed by city
+    weights = pd.Series(FLOOD_EXPOSURE_WEIGHTS)
+    exposure = (hazards[weights.index].astype('float64') * weights).sum(axis=1).rename('flood_exposure') / 100
+    exposure.index = exposure.index.astype(str)
+    return exposure
+
+
+def alert_baseline(baseline):
+    # The alert series' cells of a seasonal baseline table
+    return baseline[[f'{col}_{stat}' for col in ALERT_COLUMNS for stat in BASELINE_STATS]]
+
+
+def _leave_one_out(values, count, mean, std):
+    # Mean and std of a baseline cell without one of its own values
+    rest = count - 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Both alert series are counts or amounts, so a negative mean can only be rounding residue
+        rest_mean = np.maximum((count * mean - values) / rest, 0)
+        squares = (count - 1) * np.nan_to_num(std) ** 2 + count * mean ** 2 - values ** 2
+        rest_var = (squares - rest * rest_mean ** 2) / (rest - 1)
+    return np.where(rest > 0, rest_mean, np.nan), np.where(rest > 1, np.sqrt(np.maximum(rest_var, 0)), np.nan)
+
+
+def score_rows(rows, baseline, exposure, exclude_self=False):
+    # z-scores, quantile exceedance and flood-weighted rainfall for any set of rows (no CUSUM).
+    # exclude_self: the rows are part of the baseline, so their z-scores leave them out of it.
+    rows = rows.assign(date=pd.to_datetime(rows['date']))
+    expected = lookup_baseline(baseline, rows)
+    cities = rows['adm3_en'].astype(str)
+    columns = {'adm3_en': cities.to_numpy(), 'date': rows['date'].to_numpy()}
+    for col, name in ALERT_COLUMNS.items():
+        values = rows[col].to_numpy(dtype='float64')
+        mean, std = expected[f'{col}_mean'].to_numpy(), expected[f'{col}_std'].to_numpy()
+        if exclude_self:
+            mean, std = _leave_one_out(values, expected[f'{col}_count'].to_numpy(dtype='float64'), mean, std)
+        std = np.fmax(std, MIN_STD[col])
+        columns[col] = values
+        columns[f'{name}_expected'] = mean
+        columns[f'{name}_z'] = (values - mean) / std
+        columns[f'{name}_above_{ALERT_QUANTILE}'] = values > expected[f'{col}_{ALERT_QUANTILE}'].to_numpy()
+
+    excess_rain = np.maximum(columns['pr'] - expected['pr_q50'].to_numpy(), 0)
+    columns['flood_exposure'] = exposure.reindex(cities).fillna(0).to_numpy(dtype='float64')
+    columns['flood_rain'] = excess_rain * columns['flood_exposure']
+    return pd.DataFrame(columns, index=rows.index)
+
+
+def _cusum_step(z):
+    # Weekly CUSUM increment; a week without a score leaves the sum unchanged
+    return np.where(np.isnan(z), 0.0, np.minimum(z, CUSUM_CAP) - CUSUM_SLACK)
+
+
+def classify(scores):
+    # Alert level, ranking score and the reasons behind each flagged row
+    cases_z, cases_cusum = scores['cases_z'].to_numpy(), scores['cases_cusum'].to_numpy()
+    pr_z, pr_cusum = scores['pr_z'].to_numpy(), scores['pr_cusum'].to_numpy()
+    case_signal = ((cases_z >= Z_THRESHOLD) & scores[f'cases_above_{ALERT_QUANTILE}'].to_numpy()) | (cases_cusum >= CUSUM_THRESHOLD)
+    rain_signal = (((pr_z >= Z_THRESHOLD) & scores[f'pr_above_{ALERT_QUANTILE}'].to_numpy()) | (pr_cusum >= CUSUM_THRESHOLD)) \
+        & (scores['flood_exposure'].to_numpy() > 0)
+
+    scores = scores.assign(
+        level=np.where(case_signal, 'alert', np.where(rain_signal, 'watch', '')),
+        score=np.where(case_signal, np.fmax(cases_z / Z_THRESHOLD, cases_cusum / CUSUM_THRESHOLD),
+                       np.where(rain_signal, scores['flood_rain'].to_numpy(), 0.0)),
+    )
+    return scores
+
+
+def describe(row):
+    # Human-readable reasons for one flagged row
+    reasons = []
+    if row['cases_z'] >= Z_THRESHOLD and row[f'cases_above_{ALERT_QUANTILE}']:
+        reasons.append(f"{row['case_total']:.0f} cases vs. {row['cases_expected']:.1f} expected (z={row['cases_z']:.1f})")
+    if row['cases_cusum'] >= CUSUM_THRESHOLD:
+        reasons.append(f"sustained excess cases (CUSUM {row['cases_cusum']:.1f})")
+    if row['pr_z'] >= Z_THRESHOLD and row[f'pr_above_{ALERT_QUANTILE}']:
+        reasons.append(f"heavy rainfall {row['pr']:.1f} vs. {row['pr_expected']:.1f} expected (z={row['pr_z']:.1f})")
+    if row['pr_cusum'] >= CUSUM_THRESHOLD:
+        reasons.append(f"sustained excess rainfall (CUSUM {row['pr_cusum']:.1f})")
+    if row['flood_rain'] > 0:
+        reasons.append(f"flood-weighted excess rainfall {row['flood_rain']:.2f}")
+    return '; '.join(reasons)
+
+
+def ranked_alerts(scores):
+    # Flagged rows only, alerts before watches, highest score first
+    flagged = scores[scores['level'] != '']
+    rank = flagged['level'].map({level: i for i, level in enumerate(LEVELS)})
+    flagged = flagged.assign(_rank=rank).sort_values(['_rank', 'score'], ascending=[True, False], kind='stable')
+    flagged = flagged.drop(columns='_rank').reset_index(drop=True)
+    return flagged.assign(reasons=[describe(row) for row in flagged.to_dict('records')])
+
+
+def score_history(lepto_df, baseline, exposure):
+    # Scores of every stored row (each left out of its own baseline cell), with the CUSUM
+    # run over each city's weekly series
+    return add_cusum(score_rows(lepto_df, baseline, exposure, exclude_self=True))
+
+
+def add_cusum(scores):
+    # Classified scores with the CUSUM of each city's weekly series, from the first week given
+    panel = WeeklyPanel(scores, [f'{name}_z' for name in ALERT_COLUMNS.values()])
+    for name in ALERT_COLUMNS.values():
+        totals = np.cumsum(_cusum_step(panel[f'{name}_z']), axis=1)
+        cusum = totals - np.minimum(np.minimum.accumulate(totals, axis=1), 0)
+        scores[f'{name}_cusum'] = panel.at_rows(cusum)
+    return classify(scores)
+
+
+def latest_rows(scores):
+    # Each city's latest scored week, indexed by city
+    latest = scores.sort_values('date', kind='stable').drop_duplicates('adm3_en', keep='last')
+    return latest.set_index(pd.Index(latest['adm3_en'].to_numpy()))
+
+
+def cusum_state(scores):
+    # Latest CUSUM values per city, to continue the sums on the next batch
+    return latest_rows(scores)[['date'] + CUSUM_COLUMNS].rename_axis('adm3_en')
+
+
+def continue_cusum(scores, state=None):
+    # Add the CUSUM to scored rows of weeks after the state's, one vectorized step per week
+    # (usually a single week); returns (classified scores, updated state)
+    state = state.copy() if state is not None else pd.DataFrame(columns=['date'] + CUSUM_COLUMNS)
+    weeks = []
+    for date in np.sort(scores['date'].unique()):
+        week = scores[scores['date'] == date]
+        for name in ALERT_COLUMNS.values():
+            previous = state[f'{name}_cusum'].reindex(week['adm3_en']).fillna(0).to_numpy(dtype='float64')
+            week = week.assign(**{f'{name}_cusum': np.maximum(previous + _cusum_step(week[f'{name}_z'].to_numpy()), 0)})
+        latest = cusum_state(week)
+        state = pd.concat([state.drop(latest.index, errors='ignore'), latest])
+        weeks.append(classify(week))
+    scored = pd.concat(weeks) if weeks else classify(scores.assign(**{col: 0.0 for col in CUSUM_COLUMNS}))
+    return scored, state
+
+
+def detect(rows, baseline, exposure, state=None):
+    # Score a batch of new weeks for all its cities at once; returns (ranked alerts, updated state)
+    scored, state = continue_cusum(score_rows(rows, baseline, exposure), state)
+    return ranked_alerts(scored), state
+
+
+class AlertHistory:
+    # Scores of every stored week, with what the app and the detector need from them:
+    # each city's CUSUM state and the ranked alerts of each city's latest week
+
+    def __init__(self, scores, exposure, latest=None):
+        self.scores = scores
+        self.exposure = exposure
+        self.latest = latest_rows(scores) if latest is None else latest
+        self.state = self.latest[['date'] + CUSUM_COLUMNS].rename_axis('adm3_en')
+        self.alerts = ranked_alerts(self.latest)
+        self._by_city = {alert['adm3_en']: alert for alert in self.alerts.to_dict('records')}
+
+    def city_alert(self, city):
+        # The flagged latest week of `city` as a dict, or None
+        return self._by_city.get(city)
+
+
+def build_alert_history(lepto_df, baseline, exposure):
+    return AlertHistory(score_history(lepto_df, baseline, exposure), exposure)
+
+
+def update_alert_history(history, lepto_df, new_rows, baseline, exposure):
+    # History after `new_rows` were appended to lepto_df. The baseline cells they fall into changed,
+    # so the rows of those cells are rescored and the CUSUM is rerun for their cities.
+    rescored = score_rows(lepto_df[touched_cells(lepto_df, new_rows)], baseline, exposure, exclude_self=True)
+    kept = history.scores.drop(rescored.index, errors='ignore')
+    cities = kept['adm3_en'].isin(rescored['adm3_en'].unique())
+    rerun = add_cusum(pd.concat([kept[cities].drop(columns=CUSUM_COLUMNS + ['level', 'score']), rescored]))
+    # Appended rows are later weeks, so each of their cities' latest week is among them
+    newest = new_rows.sort_values('date', kind='stable').drop_duplicates('adm3_en', keep='last').index
+    latest = latest_rows(rerun.loc[newest])
+    latest = pd.concat([history.latest.drop(latest.index, errors='ignore'), latest])
+    return AlertHistory(pd.concat([kept[~cities], rerun]).sort_index(), exposure, latest)
+
+
+def load_alert_history(path=DATA_PATH):
+    # AlertHistory of the currently cached dataset, against its cached seasonal baseline.
+    # The baseline is looked up first: derived() must not be re-entered from a builder.
+    baseline = load_seasonal_baseline(path)
+
+    def build(facts):
+        return build_alert_history(facts, alert_baseline(baseline), flood_exposure(load_lepto_dataset(path).cities))
+
+    def update(history, facts, new_rows):
+        return update_alert_history(history, facts, new_rows, alert_baseline(baseline),
+                                    flood_exposure(load_lepto_dataset(path).cities))
+
+    return derived(path, 'alert_history', build, update)
+
+
+def latest_alerts(path=DATA_PATH):
+    # Ranked alerts of each city's latest stored week
+    return load_alert_history(path).alerts
+
+
+def city_alert(city, path=DATA_PATH):
+    # Alert of the city's latest stored week as a dict, or None when it was not flagged
+    return load_alert_history(path).city_alert(city)
+
+
+def alert_records(alerts, top=None):
+    # JSON-ready summary of ranked alerts
+    alerts = alerts if top is None else alerts.head(top)
+    return [
+        {'city': row['adm3_en'], 'week': row['date'].strftime('%Y-%m-%d'), 'level': row['level'],
+         'score': round(float(row['score']), 3), 'reasons': row['reasons']}
+        for row in alerts.to_dict('records')
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Early-warning alerts against the seasonal baseline.")
+    parser.add_argument('--data', default=DATA_PATH, help="path to lepto_dfclean.csv")
+    parser.add_argument('--week', default=None, help="score this stored week (default: each city's latest)")
+    parser.add_argument('--batch', default=None, help="score the new weeks in this CSV against the stored data")
+    parser.add_argument('--top', type=int, default=None, help="show only the N highest-ranked alerts")
+    parser.add_argument('--json', action='store_true', help="print the alerts as JSON")
+    args = parser.parse_args()
+
+    history = load_alert_history(args.data)
+    if args.batch:
+        baseline = alert_baseline(load_seasonal_baseline(args.data))
+        alerts, _ = detect(pd.read_csv(args.batch), baseline, history.exposure, history.state)
+    elif args.week:
+        alerts = ranked_alerts(history.scores[history.scores['date'] == pd.Timestamp(args.week)])
+    else:
+        alerts = history.alerts
+
+    records = alert_records(alerts, args.top)
+    if args.json:
+        print(json.dumps(records, indent=2))
+    elif not records:
+        print("No alerts.")
+    for record in [] if args.json else records:
+        print(f"[{record['level']}] {record['city']} {record['week']} (score {record['score']}): {record['reasons']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
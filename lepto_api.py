@@ -0,0 +1,242 @@
+"""Headless JSON API for the City Insights numbers.
+
+Serves the same per-city figures as the Streamlit page (peak year, top
+months, weeks with/without cases, risk-factor overlays) straight from the
+precomputed aggregates, on a thread-pooled HTTP server:
+
+    python lepto_api.py --port 8502
+
+    GET /cities                              list of cities
+    GET /cities/<city>                       city summary
+    GET /cities/<city>/overlay?feature=pr    monthly cases vs. a risk factor
+    GET /cities/<city>/baseline?week=32      seasonal baseline (all ISO weeks without ?week)
+    GET /stats                               request counts and p50/p99 latency
+    GET /health
+"""
+
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import numpy as np
+
+from lepto_data import DATA_PATH, SUMMARY_PATH, load_city_summary, dataset_version
+from lepto_aggregates import OVERLAY_FEATURES, MONTH_NAMES, load_city_cube, load_seasonal_baseline, min_max_scale
+
+# Number of recent request latencies kept per route for the percentiles
+LATENCY_WINDOW = 10000
+
+# Significant digits of the baseline statistics in responses; more would only show float64 arithmetic residue
+BASELINE_DIGITS = 12
+
+
+def _number(value):
+    # Plain Python numbers for json.dumps
+    value = value.item() if hasattr(value, 'item') else value
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def city_insights(city, data_path=DATA_PATH, summary_path=SUMMARY_PATH):
+    # Everything the City Insights page shows for a city, as plain JSON-ready values
+    city_aggs = load_city_cube(data_path)[city]
+    city_summary = load_city_summary(summary_path)
+    city_info = city_summary[city_summary['adm3_en'] == city].iloc[0]
+
+    return {
+        'city': city,
+        'city_area': _number(city_info['city_area']),
+        'pop_count_total': _number(city_info['pop_count_total']),
+        'pop_density': _number(city_info['pop_density']),
+        'case_total': _number(city_info['case_total']),
+        'peak_year': _number(city_aggs['max_year']),
+        'peak_year_cases': _number(city_aggs['max_cases']),
+        'yearly_cases': {str(year): _number(cases) for year, cases in zip(city_aggs['yearly']['year'], city_aggs['yearly']['case_total'])},
+        'peak_monthly_average': _number(city_aggs['peak_cases']),
+        'top_months': [
+            {'month': MONTH_NAMES[int(month) - 1], 'average_cases': _number(cases)}
+            for month, cases in zip(city_aggs['top_months']['month'], city_aggs['top_months']['case_total'])
+        ],
+        'weeks_with_cases': city_aggs['with_case_count'],
+        'weeks_without_cases': city_aggs['without_case_count'],
+    }
+
+
+def city_overlay(city, feature, data_path=DATA_PATH):
+    # Average monthly cases and risk-factor values, raw and min-max scaled (Visualization 4)
+    monthly_avg = load_city_cube(data_path)[city]['monthly_avg']
+    return {
+        'city': city,
+        'feature': feature,
+        'months': [MONTH_NAMES[int(month) - 1] for month in monthly_avg['month']],
+        'case_total': [_number(v) for v in monthly_avg['case_total']],
+        feature: [_number(v) for v in monthly_avg[feature]],
+        'case_total_scaled': [_number(v) for v in min_max_scale(monthly_avg['case_total'])],
+        f'{feature}_scaled': [_number(v) for v in min_max_scale(monthly_avg[feature])],
+    }
+
+
+def city_baseline(city, week=None, data_path=DATA_PATH):
+    # Per ISO week: count, mean, std and quantiles of the cases and climate values (None where undefined)
+    baseline = load_seasonal_baseline(data_path).loc[city]
+    if week is not None:
+        baseline = baseline[baseline.index == week]
+    return {
+        'city': city,
+        'weeks': {
+            str(week): {col: None if np.isnan(value) else _number(float(f'{value:.{BASELINE_DIGITS}g}'))
+                        for col, value in zip(baseline.columns, row)}
+            for week, row in zip(baseline.index, baseline.to_numpy(dtype='float64'))
+        },
+    }
+
+
+class LatencyStats:
+    # Request counts and a rolling window of latencies per route
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.counts = defaultdict(int)
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds):
+        with self._lock:
+            self.counts[route] += 1
+            self.latencies[route].append(seconds)
+
+    def summary(self):
+        with self._lock:
+            routes = {route: np.array(values) for route, values in self.latencies.items()}
+            counts = dict(self.counts)
+        report = {}
+        for route, values in routes.items():
+            report[route] = {
+                'requests': counts[route],
+                'p50_ms': round(float(np.percentile(values, 50)) * 1000, 3),
+                'p99_ms': round(float(np.percentile(values, 99)) * 1000, 3),
+            }
+        return report
+
+
+class LeptoAPIHandler(BaseHTTPRequestHandler):
+    server_version = 'LeptoShieldAPI/1.0'
+
+    def do_GET(self):
+        start = time.perf_counter()
+        parts = urlsplit(self.path)
+        segments = [unquote(segment) for segment in parts.path.strip('/').split('/') if segment]
+        query = parse_qs(parts.query)
+
+        route, status, body = self.server.dispatch(segments, query)
+        payload = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.stats.record(route, time.perf_counter() - start)
+
+    def log_message(self, format, *args):
+        # Per-request logging would dominate the latency; use /stats instead
+        pass
+
+
+class LeptoAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data_path=DATA_PATH, summary_path=SUMMARY_PATH):
+        super().__init__(address, LeptoAPIHandler)
+        self.data_path = data_path
+        self.summary_path = summary_path
+        self.stats = LatencyStats()
+        # Rendered responses of the current dataset version: route key -> body
+        self._responses_version = None
+        self._responses = {}
+        self._responses_lock = threading.Lock()
+
+    def _find_city(self, name):
+        cities = load_city_cube(self.data_path)
+        if name in cities:
+            return name
+        lowered = {city.lower(): city for city in cities}
+        return lowered.get(name.lower())
+
+    def _cached(self, key, build):
+        version = dataset_version(self.data_path)
+        with self._responses_lock:
+            # A new dataset version makes every stored response stale
+            if version != self._responses_version:
+                self._responses_version = version
+                self._responses = {}
+            if key in self._responses:
+                return self._responses[key]
+        body = build()
+        with self._responses_lock:
+            if version == self._responses_version:
+                self._responses[key] = body
+        return body
+
+    def dispatch(self, segments, query):
+        # Returns (route name, HTTP status, JSON body)
+        try:
+            if segments == ['health']:
+                return 'health', 200, {'status': 'ok'}
+            if segments == ['stats']:
+                return 'stats', 200, self.stats.summary()
+            if segments == ['cities']:
+                return 'cities', 200, sorted(load_city_cube(self.data_path))
+
+            if len(segments) in (2, 3) and segments[0] == 'cities':
+                city = self._find_city(segments[1])
+                if city is None:
+                    return 'not_found', 404, {'error': f"Unknown city: {segments[1]}"}
+                if len(segments) == 2:
+                    return 'city', 200, self._cached(('city', city), lambda: city_insights(city, self.data_path, self.summary_path))
+                if segments[2] == 'overlay':
+                    feature = query.get('feature', [OVERLAY_FEATURES[0]])[0]
+                    if feature not in OVERLAY_FEATURES:
+                        return 'bad_request', 400, {'error': f"feature must be one of {OVERLAY_FEATURES}"}
+                    return 'overlay', 200, self._cached(('overlay', city, feature), lambda: city_overlay(city, feature, self.data_path))
+                if segments[2] == 'baseline':
+                    week = query.get('week', [None])[0]
+                    if week is not None and not (week.isdigit() and 1 <= int(week) <= 53):
+                        return 'bad_request', 400, {'error': "week must be an ISO week number between 1 and 53"}
+                    week = None if week is None else int(week)
+                    return 'baseline', 200, self._cached(('baseline', city, week), lambda: city_baseline(city, week, self.data_path))
+
+            return 'not_found', 404, {'error': f"Unknown path: /{'/'.join(segments)}"}
+        except FileNotFoundError as e:
+            return 'error', 503, {'error': f"Dataset not available: {e}"}
+
+
+def serve(host='127.0.0.1', port=8502, data_path=DATA_PATH, summary_path=SUMMARY_PATH):
+    server = LeptoAPIServer((host, port), data_path, summary_path)
+    # Load and aggregate the data before accepting requests
+    load_city_cube(data_path)
+    load_city_summary(summary_path)
+    print(f"LeptoShield API listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats.summary(), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the LeptoShield city insights as JSON.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--data', default=DATA_PATH, help="path to lepto_dfclean.csv")
+    parser.add_argument('--summary', default=SUMMARY_PATH, help="path to city_summary.csv")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.data, args.summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,18 @@
+import os
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import MinMaxScaler
+from lepto_data import load_lepto_df, load_city_summary, load_city_index
+from lepto_aggregates import load_city_cube, OVERLAY_FEATURES
+from lepto_alerts import load_alert_history, city_alert
+from lepto_charts import get_chart, is_cached, start_prewarm
+from lepto_timing import start_run, stage, fragment_run, finish_run, active_timer
+from lepto_metrics import start_metrics_server, record_view
 
 # Set the page configuration (title only, no icon)
 st.set_page_config(page_title="LeptoShield", layout="centered")
 
-# Set matplotlib's default color scheme for the plots
-plt.rcParams.update({
-    'axes.facecolor': 'white',
-    'axes.edgecolor': '#3d3d3d',
-    'axes.labelcolor': 'gray',
-    'xtick.color': 'gray',
-    'ytick.color': 'gray',
-    'text.color': '#19535b',
-    'figure.facecolor': 'white',
-    'figure.edgecolor': 'white',
-    'grid.color': '#3d3d3d',
-    'lines.color': '#19535b',
-    'axes.titlecolor': 'gray',
-})
+# Time this rerun stage by stage when LEPTO_TIMING=1 or ?timing=1
+start_run()
 
 # Add custom CSS for Streamlit theme with adjustments for title, description, and spacing
 st.markdown("""
@@ -100,16 +93,26 @@ st.markdown("""
 
 # Load your dataset and handle errors
 try:
-    lepto_df = pd.read_csv('lepto_dfclean.csv')
-    city_summary = pd.read_csv('city_summary.csv')
+    # Parsed once per process and shared across sessions; re-parsed only when the CSVs change
+    with stage('load_data'):
+        lepto_df = load_lepto_df('lepto_dfclean.csv')
+        city_summary = load_city_summary('city_summary.csv')
+    # Precomputed yearly/monthly/weekly aggregates for every city
+    with stage('load_aggregates'):
+        city_cube = load_city_cube('lepto_dfclean.csv')
+        city_index = load_city_index('lepto_dfclean.csv')
+        # Every stored week scored against the seasonal baseline (for the early-warning line)
+        load_alert_history('lepto_dfclean.csv')
+
+    # Optionally render every city/chart/feature combination in the background at startup
+    if os.environ.get('LEPTO_PREWARM_CHARTS') == '1':
+        start_prewarm('lepto_dfclean.csv')
+
+    # Serve Prometheus metrics on LEPTO_METRICS_PORT (started once per process)
+    start_metrics_server()
     
     if lepto_df.empty or city_summary.empty:
         st.error("One or more datasets are empty. Please check the CSV files.")
-    else:
-        lepto_df['date'] = pd.to_datetime(lepto_df['date'])
-        lepto_df['month'] = lepto_df['date'].dt.month
-        lepto_df['year'] = lepto_df['date'].dt.year
-        lepto_df['week'] = lepto_df['date'].dt.isocalendar().week
 
 except FileNotFoundError:
     st.error("One or more files were not found. Please upload the correct files and ensure the paths are correct.")
@@ -118,26 +121,18 @@ except pd.errors.EmptyDataError:
 except Exception as e:
     st.error(f"An unexpected error occurred: {e}")
 
+# Independently re-executing page sections (plain functions on Streamlit versions without fragments)
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda func: func)
+
 if 'lepto_df' in locals() and not lepto_df.empty and 'city_summary' in locals() and not city_summary.empty:
-    def main():
-        st.title("LeptoShield")
-        # Display the app description and disclaimer
-        description = """
-        **This app analyzes key risk factors for leptospirosis. It aims to assist cities in implementing timely interventions, benefiting government agencies, communities, public health professionals, and medical personnel. For informational purposes only**
-        """
-        st.markdown(description)
+    def show_chart(selected_city, chart, feature=None):
+        # Fetch (or render) the chart, then send it to the page; timed separately
+        with stage(f'chart_{chart}', city=selected_city, feature=feature, cached=is_cached(selected_city, chart, feature) if active_timer() else None):
+            image = get_chart(selected_city, chart, feature)
+        with stage(f'image_{chart}'):
+            st.image(image, width='stretch')
 
-        st.header("City Insights")
-        
-        # Arrange the selectors side by side without labels
-        col1, col2 = st.columns(2)
-        with col1:
-            #Alphabetize the city names before passing them to the selectbox
-            sorted_cities = sorted(lepto_df['adm3_en'].unique())
-            selected_city = st.selectbox("", sorted_cities)
-            
-        # Filter data for the selected city
-        city_data = lepto_df[lepto_df['adm3_en'] == selected_city]
+    def show_city_info(selected_city):
         city_info = city_summary[city_summary['adm3_en'] == selected_city].iloc[0]  # Get city-specific information
         
         # Update placeholders with actual data from city_summary
@@ -155,153 +150,107 @@ if 'lepto_df' in locals() and not lepto_df.empty and 'city_summary' in locals()
         <b>Total Number of Recorded Cases:</b> {total_cases} (2008-2020)</div>
         """, unsafe_allow_html=True)
 
+    def show_early_warning(selected_city):
+        # Early-warning status of the city's latest stored week, if it was flagged
+        alert = city_alert(selected_city, 'lepto_dfclean.csv')
+        if alert is None:
+            return
+        message = f"**Early warning ({alert['level']}), week of {alert['date']:%Y-%m-%d}:** {alert['reasons']}"
+        if alert['level'] == 'alert':
+            st.warning(message)
+        else:
+            st.info(message)
+
+    def show_cases_summary(selected_city):
+        # Look up the precomputed aggregates for the selected city
+        city_aggs = city_cube[selected_city]
+
         # Placeholder for Leptospirosis Cases Summary
         st.markdown("### Leptospirosis Cases Summary")
         
         # Layout for 3 columns
         col1, col2, col3 = st.columns(3)
 
-        # Set uniform figure size
-        fig_size = (4, 4)
-
         # Visualization 1: Total Number of Cases per Year (2008-2020)
         with col1:
-            yearly_cases = city_data.groupby('year')['case_total'].sum().reset_index()
-
-            # Find the year with the maximum number of cases
-            max_year = yearly_cases.loc[yearly_cases['case_total'].idxmax(), 'year']
-            max_cases = yearly_cases['case_total'].max()
-
-            fig, ax = plt.subplots(figsize=fig_size)
-
-            # Color the bars based on whether they are the maximum year or not
-            bar_colors = ['#19535b' if year == max_year else '#d9d9d9' for year in yearly_cases['year']]
-    
-            ax.bar(yearly_cases['year'], yearly_cases['case_total'], color=bar_colors)
-            ax.set_xticks(range(2008, 2021))
-            ax.set_xticklabels([str(year)[-2:] for year in range(2008, 2021)], fontsize=8)
-            ax.set_title('Total Cases Per Year (2008-2020)', fontsize=14, color='gray')
-            st.pyplot(fig)
+            show_chart(selected_city, 'yearly')
 
         # Visualization 2: Average Monthly Cases
         with col2:
-            # Grouping data by year and month, then calculating the monthly average
-            monthly_data = city_data.groupby(['year', 'month'])['case_total'].sum().reset_index()
-            monthly_avg = monthly_data.groupby('month')['case_total'].mean().reset_index()
-
-            # Sorting to find the top 3 months with the highest average cases
-            top_months_sorted = monthly_avg.sort_values(by='case_total', ascending=False).head(3)
-    
-            # Extracting the peak cases and formatting the top month names
-            peak_cases = monthly_avg['case_total'].max()
-            top_month_names = [
-                ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'][int(row['month']) - 1]
-                for _, row in top_months_sorted.iterrows()
-            ]
-            
-            # Joining month names into a readable string
-            top_months_str = ", ".join(top_month_names[:-1]) + ", and " + top_month_names[-1]
-        
-            # Plotting the data
-            fig, ax = plt.subplots(figsize=fig_size)
-            ax.plot(monthly_avg['month'], monthly_avg['case_total'], marker='o', color='#d9d9d9', markersize=6)
-            ax.set_xticks(range(1, 13))
-            ax.set_xticklabels(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], fontsize=8)
-            ax.set_title('Average Monthly Cases', fontsize=14, color='gray')
-        
-            # Highlighting the top 3 months
-            for _, row in top_months_sorted.iterrows():
-                ax.plot(row['month'], row['case_total'], marker='o', color='#19535b', markersize=6)
-                month_abbr = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'][int(row['month']) - 1]
-                ax.text(row['month'] + 0.4, row['case_total'], month_abbr, color='#19535b', ha='left', fontsize=8)
-        
-            # Displaying the plot
-            st.pyplot(fig)
+            show_chart(selected_city, 'monthly')
 
         # Visualization 3: Weeks with Cases vs. Weeks without Cases
         with col3:
-            case_counts = city_data['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
-            with_case_count = case_counts.get('With Case', 0)
-            without_case_count = case_counts.get('Without Case', 0)
-
-            # Prepare data for plotting
-            weekly_counts = pd.DataFrame({
-                'case_category': ['With Cases', 'Without Cases'],
-                'count': [with_case_count, without_case_count]
-            })
-
-            fig, ax = plt.subplots(figsize=fig_size)
-            ax.bar(weekly_counts['case_category'], weekly_counts['count'], color=['#19535b', '#d9d9d9'])
-            ax.set_title('No. of Weeks With/Without Cases', fontsize=14, color='gray')
-            st.pyplot(fig)
+            show_chart(selected_city, 'weekly')
 
         # Layout for 3 columns
         col1, col2, col3 = st.columns(3)
-
-        # Set uniform figure size
-        fig_size = (4, 4)
         with col1:
-            st.markdown(f"The total number of cases peaked at **{max_cases}** in **{max_year}**")
+            st.markdown(f"The total number of cases peaked at **{city_aggs['max_cases']}** in **{city_aggs['max_year']}**")
         with col2:
-            st.markdown(f"The average monthly cases peaked at **{int(peak_cases)}** and were highest in **{top_months_str}**.")
+            st.markdown(f"The average monthly cases peaked at **{int(city_aggs['peak_cases'])}** and were highest in **{city_aggs['top_months_str']}**.")
         with col3:
-            st.markdown(f"From 2008-2020, there were {with_case_count} weeks **with cases** and {without_case_count} **weeks without cases**.")
+            st.markdown(f"From 2008-2020, there were {city_aggs['with_case_count']} weeks **with cases** and {city_aggs['without_case_count']} **weeks without cases**.")
 
-        # Placeholder for Leptospirosis Cases Summary
-        st.markdown("### Leptospirosis Risk Factors")
-        # Layout for 2 columns in the second row
-        col1, col2 = st.columns(2)
-        
-        # Dropdown for selecting the feature to overlay
-        with col1:
-            feature = st.selectbox(
-                '',  # Empty label to remove the text above the dropdown
-                options=['heat_index', 'rh', 'pr']
-            )
-        # Layout for 2 columns in the third row
-        col1, col2 = st.columns(2)
-
-        # Visualization 4: Overlay Selected Feature with Monthly Aggregation
-        with col1:
-            # Grouping data by year and month, then calculating the monthly average for case total and the selected feature
-            monthly_data = city_data.groupby(['year', 'month']).agg({
-                'case_total': 'sum',
-                feature: 'mean'
-            }).reset_index()
-        
-            # Averaging the same month throughout the years
-            monthly_avg = monthly_data.groupby('month').agg({
-                'case_total': 'mean',
-                feature: 'mean'
-            }).reset_index()
-        
-            # Scaling the features to overlay on the same scale
-            scaler = MinMaxScaler()
-            scaled_features = scaler.fit_transform(monthly_avg[[feature]])
-            scaled_df = pd.DataFrame(scaled_features, columns=[feature])
-            scaled_df['month'] = monthly_avg['month']
-            scaled_df['case_total'] = scaler.fit_transform(monthly_avg[['case_total']])
-        
-            # Plotting the data with the scaled selected feature
-            fig, ax = plt.subplots(figsize=fig_size)
+    # Changing the feature only re-runs this section (the overlay chart)
+    @fragment
+    def show_risk_factors(selected_city):
+        with fragment_run('risk_factors'):
+            # Placeholder for Leptospirosis Cases Summary
+            st.markdown("### Leptospirosis Risk Factors")
+            # Layout for 2 columns in the second row
+            col1, col2 = st.columns(2)
             
-            # Plotting case total and the selected feature
-            ax.plot(scaled_df['month'], scaled_df['case_total'], marker='o', label='Case Total', color='#d9d9d9', markersize=6)
-            ax.plot(scaled_df['month'], scaled_df[feature], marker='o', label=feature.replace('_', ' ').title(), color='#19535b', markersize=4)
-            
-            # Setting up x-axis labels and title
-            ax.set_xticks(range(1, 13))
-            ax.set_xticklabels(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], fontsize=8)
-            ax.set_title(f'Cases vs {feature.replace("_", " ").title()}', fontsize=10, color='gray')
-            ax.legend(fontsize=8)
-        
-            # Displaying the plot
-            st.pyplot(fig)
+            # Dropdown for selecting the feature to overlay
+            with col1:
+                feature = st.selectbox(
+                    '',  # Empty label to remove the text above the dropdown
+                    options=OVERLAY_FEATURES
+                )
+            record_view(selected_city, feature)
+            # Layout for 2 columns in the third row
+            col1, col2 = st.columns(2)
+
+            # Visualization 4: Overlay Selected Feature with Monthly Aggregation
+            with col1:
+                show_chart(selected_city, 'overlay', feature)
+
+            # Placeholder for the second column
+            with col2:
+                # You can use st.empty() or a simple text placeholder
+                st.empty()
+
+    # Changing the city only re-runs the city insights, not the page header
+    @fragment
+    def show_city_insights():
+        with fragment_run('city_insights'):
+            # Arrange the selectors side by side without labels
+            col1, col2 = st.columns(2)
+            with col1:
+                #Alphabetize the city names before passing them to the selectbox
+                sorted_cities = city_index.cities
+                selected_city = st.selectbox("", sorted_cities)
+            record_view(selected_city)
+
+            with stage('city_info'):
+                show_city_info(selected_city)
+                show_early_warning(selected_city)
+            show_cases_summary(selected_city)
+            show_risk_factors(selected_city)
+
+    def main():
+        st.title("LeptoShield")
+        # Display the app description and disclaimer
+        description = """
+        **This app analyzes key risk factors for leptospirosis. It aims to assist cities in implementing timely interventions, benefiting government agencies, communities, public health professionals, and medical personnel. For informational purposes only**
+        """
+        st.markdown(description)
+
+        st.header("City Insights")
+        show_city_insights()
+
+        # Render timing breakdown for this rerun (only when timing is on)
+        finish_run(active_timer())
 
-        
-        # Placeholder for the second column
-        with col2:
-            # You can use st.empty() or a simple text placeholder
-            st.empty()
     if __name__ == "__main__":
         main()
@@ -22,6 +22,12 @@ from collections import Counter
 from sklearn.preprocessing import MinMaxScaler
 warnings.filterwarnings("ignore")
 
+# per-city data access and binary snapshots of the cleaned data
+from lepto_data import CityIndex
+from lepto_snapshot import read_lepto_table, save_table
+from lepto_aggregates import build_case_summaries, save_case_summaries
+from lepto_correlation import lagged_correlations
+
 # visualizations
 import seaborn as sns
 from termcolor import colored
@@ -229,40 +235,30 @@ lepto_df['adm3_en'] = lepto_df['adm3_en'].str.replace(' City$', '', regex=True)
 
 lepto_df['adm3_en'].value_counts()
 
-# Save the results DataFrame to a CSV file in Google Drive
+# Save the results DataFrame to a CSV file in Google Drive, with a binary snapshot partitioned by city
 file_path = '/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv'
-lepto_df.to_csv(file_path, index=False)
+save_table(lepto_df, file_path)
 
 """# EDA"""
 
-lepto_df = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
+lepto_df = read_lepto_table('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
 lepto_df.head()
 
 """## Cases"""
 
-# Convert 'date' column to datetime
-lepto_df['date'] = pd.to_datetime(lepto_df['date'])
+# Total, yearly and monthly cases per city and the top-3 years/months, in one grouped pass.
+# The charts below reuse these tables instead of re-reading the CSVs.
+case_summaries = build_case_summaries(lepto_df)
 
 # 1. Sum of cases for the whole dataset
-total_cases = lepto_df['case_total'].sum()
-
-# 2. Sum of cases per city for the whole dataset
-total_cases_per_city = lepto_df.groupby('adm3_en')['case_total'].sum()
-
-# 3. Sum of cases per city per year
-cases_per_city_per_year = lepto_df.groupby([lepto_df['date'].dt.year, 'adm3_en'])['case_total'].sum().unstack()
-
-# 4. Sum of cases per city per month
-cases_per_city_per_month = lepto_df.groupby([lepto_df['date'].dt.to_period('M'), 'adm3_en'])['case_total'].sum().unstack()
+total_cases = case_summaries['total'].sum()
 
 # Save the results as CSV files in Google Drive
-total_cases_per_city.to_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/total_cases_per_city.csv', index=True)
-cases_per_city_per_year.to_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/cases_per_city_per_year.csv', index=True)
-cases_per_city_per_month.to_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/cases_per_city_per_month.csv', index=True)
+save_case_summaries(case_summaries, '/content/drive/MyDrive/Leptospirosis CCHAIN')
 
 """### Total Cases"""
 
-lepto_df = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
+lepto_df = read_lepto_table('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
 lepto_df.head()
 
 lepto_df.shape
@@ -299,7 +295,7 @@ plt.grid(False)
 # Show plot
 plt.show()
 
-total = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/total_cases_per_city.csv')
+total = case_summaries['total'].reset_index()
 print(total)
 
 # Sort the DataFrame by 'case_total' in descending order
@@ -344,60 +340,13 @@ plt.show()
 
 """### Yearly Cases"""
 
-yearly = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/cases_per_city_per_year.csv')
+yearly = case_summaries['yearly'].reset_index()
 yearly.head()
 
-# Ensure the 'date' column is in datetime format and set it as the index
-yearly['date'] = pd.to_datetime(yearly['date'], format='%Y')
-yearly.set_index('date', inplace=True)
-
-# Extract year from the 'date' index
-yearly['year'] = yearly.index.year
-
-# Calculate the sum of cases per year for each city
-yearly_sum = yearly.groupby(['year']).sum()
-
-# Initialize a list to store the results
-results = []
-
-# Calculate total cases for each city
-total_cases = yearly_sum.sum()
-
-# Find the top 3 years with the highest total number of cases for each city
-for city in yearly_sum.columns:
-    top_3 = yearly_sum[city].nlargest(3)
-    top_3_years = ', '.join(top_3.index.astype(str))
-    top_3_sums = ', '.join(f'{total:.2f}' for total in top_3.values)
-    sum_top_3 = top_3.sum()
-    top_3_sum_avg = top_3.mean()
-
-    # Calculate percentage of the top 3 years' sum out of total cases
-    total = total_cases[city]
-    percentage_top_3 = (sum_top_3 / total) * 100 if total > 0 else 0
-
-    results.append({
-        'City': city,
-        'Top 3 Years': top_3_years,
-        'Top 3 Sums': top_3_sums,
-        'Sum of Top 3 Years': f'{sum_top_3:.2f}',
-        'Percentage of Top 3 Years': f'{percentage_top_3:.2f}%'
-    })
-
-# Convert results to DataFrame
-results_df = pd.DataFrame(results)
-
-# Sort DataFrame by 'Sum of Top 3 Years' in descending order
-results_df['Sum of Top 3 Years'] = results_df['Sum of Top 3 Years'].astype(float)
-results_df.sort_values(by='Sum of Top 3 Years', ascending=False, inplace=True)
-
-# Save the results DataFrame to a CSV file in Google Drive
-file_path = '/content/drive/MyDrive/Leptospirosis CCHAIN/top_3_years_summary.csv'
-results_df.to_csv(file_path, index=False)
-
-yearlytop3 = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/top_3_years_summary.csv')
+yearlytop3 = case_summaries['top3_years']
 yearlytop3.head(12)
 
-yearly = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/cases_per_city_per_year.csv')
+yearly = case_summaries['yearly'].reset_index()
 
 # Sum the cases for all cities per year
 yearly['total_cases'] = yearly.drop(columns='date').sum(axis=1)
@@ -426,10 +375,8 @@ plt.yticks(fontsize=14)
 plt.tight_layout()
 plt.show()
 
-yearly = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/cases_per_city_per_year.csv')
-
-# Set 'date' column as the index
-yearly.set_index('date', inplace=True)
+# Year x city table, indexed by year
+yearly = case_summaries['yearly']
 
 # Plot the time series for each city
 plt.figure(figsize=(14, 8))
@@ -447,10 +394,8 @@ plt.tight_layout()
 # Show the plot
 plt.show()
 
-yearly = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/cases_per_city_per_year.csv')
-
-# Set 'date' column as the index
-yearly.set_index('date', inplace=True)
+# Year x city table, indexed by year
+yearly = case_summaries['yearly']
 
 # Create and display a plot for each city
 for city in yearly.columns:
@@ -467,64 +412,14 @@ for city in yearly.columns:
 
 """### Monthly Cases"""
 
-monthly = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/cases_per_city_per_month.csv')
+monthly = case_summaries['monthly'].to_timestamp()
 monthly.head()
 
-# Ensure the 'date' column is in datetime format and set it as the index
-monthly['date'] = pd.to_datetime(monthly['date'], format='%Y-%m')
-monthly.set_index('date', inplace=True)
-
-# Extract month from the 'date' index
-monthly['month'] = monthly.index.month
-
-# Calculate the sum of cases per month for each city
-monthly_sum = monthly.groupby(['month']).sum()
-
-# Initialize a list to store the results
-results = []
-
-# Calculate total cases for each city
-total_cases = monthly_sum.sum()
-
-# Find the top 3 months with the highest total number of cases for each city
-for city in monthly_sum.columns:
-    top_3 = monthly_sum[city].nlargest(3)
-    top_3_months = ', '.join(top_3.index.astype(str))
-    top_3_sums = ', '.join(f'{total:.2f}' for total in top_3.values)
-    sum_top_3 = top_3.sum()
-    top_3_sum_avg = top_3.mean()
-
-    # Calculate percentage of the top 3 months' sum out of total cases
-    total = total_cases[city]
-    percentage_top_3 = (sum_top_3 / total) * 100 if total > 0 else 0
-
-    results.append({
-        'City': city,
-        'Top 3 Months': top_3_months,
-        'Top 3 Sums': top_3_sums,
-        'Sum of Top 3 Months': f'{sum_top_3:.2f}',
-        'Percentage of Top 3 Months': f'{percentage_top_3:.2f}%'
-    })
-
-# Convert results to DataFrame
-results_df = pd.DataFrame(results)
-
-# Sort DataFrame by 'Sum of Top 3 Months' in descending order
-results_df['Sum of Top 3 Months'] = results_df['Sum of Top 3 Months'].astype(float)
-results_df.sort_values(by='Sum of Top 3 Months', ascending=False, inplace=True)
-
-# Save the results DataFrame to a CSV file in Google Drive
-file_path = '/content/drive/MyDrive/Leptospirosis CCHAIN/top_3_months_summary.csv'
-results_df.to_csv(file_path, index=False)
-
-monthly = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/top_3_months_summary.csv')
+monthly = case_summaries['top3_months']
 monthly.head(12)
 
-monthly = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/cases_per_city_per_month.csv')
-
-# Ensure the 'date' column is in datetime format and set it as the index
-monthly['date'] = pd.to_datetime(monthly['date'], format='%Y-%m')
-monthly.set_index('date', inplace=True)
+# Month x city table, indexed by the first day of each month
+monthly = case_summaries['monthly'].to_timestamp()
 
 # Create and display a plot for each city
 for city in monthly.columns:
@@ -543,7 +438,7 @@ for city in monthly.columns:
     # Show the plot
     plt.show()
 
-monthly = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/cases_per_city_per_month.csv')
+monthly = case_summaries['monthly'].to_timestamp().reset_index()
 
 # Isolate the data for Iloilo City between the years 2011 and 2012
 iloilo_data = monthly[(monthly['date'] >= '2011-01') & (monthly['date'] <= '2013-12')][['date', 'Iloilo']]
@@ -710,6 +605,9 @@ plt.show()
 # Get unique cities
 cities = lepto_df['adm3_en'].unique()
 
+# Sort once by city and date so each city is a contiguous slice
+city_index = CityIndex(lepto_df)
+
 # Define the columns to exclude
 exclude_columns = [
     'date', 'adm3_en',
@@ -747,7 +645,7 @@ for column in numeric_columns:
     for i, city in enumerate(cities):
         if i < len(axes):
             ax = axes[i]  # Position the histogram in the correct subplot
-            city_data = lepto_df[lepto_df['adm3_en'] == city]
+            city_data = city_index[city]
             ax.hist(city_data[column], bins=30, color=hist_color)
             ax.set_title(f'{column} in {city}')
             ax.set_xlabel(column)
@@ -763,7 +661,7 @@ for column in numeric_columns:
 
 """## Correlation"""
 
-lepto_df = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
+lepto_df = read_lepto_table('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
 lepto_df.head()
 
 # Drop the 'adm3_pcode' and 'date' columns
@@ -858,6 +756,14 @@ plt.show()
 print("Correlation Matrix:")
 print(correlation_matrix)
 
+"""### Lagged Correlation"""
+
+# Spearman correlation of each week's cases with the features 0-8 weeks earlier, for every city at once
+lag_correlations = lagged_correlations(lepto_df, max_lag=8, method='spearman')
+
+# Lag with the strongest correlation per city and feature
+lag_correlations.strongest().pivot(index='adm3_en', columns='feature', values='lag')
+
 """## Time Series"""
 
 # Convert 'date' column to datetime format (if not already done)
@@ -866,14 +772,17 @@ lepto_df['date'] = pd.to_datetime(lepto_df['date'])
 # Set the 'date' column as the index
 lepto_df.set_index('date', inplace=True)
 
+# Sort once by city and date so each city is a contiguous slice
+city_index = CityIndex(lepto_df)
+
 # Assuming lepto_df is your DataFrame and it's already prepared
 # Get the unique city names
 cities = lepto_df['adm3_en'].unique()
 
 # Loop through each city and create a separate plot
 for city in cities:
-    # Filter the dataframe for the specific city
-    city_data = lepto_df[lepto_df['adm3_en'] == city]
+    # Slice the dataframe for the specific city
+    city_data = city_index[city]
 
     # Set up the figure
     plt.figure(figsize=(10, 6))
@@ -915,8 +824,8 @@ scaler = MinMaxScaler()
 
 # Loop through each city
 for city in cities:
-    # Filter the dataframe for the specific city
-    city_data = lepto_df[lepto_df['adm3_en'] == city]
+    # Slice the dataframe for the specific city
+    city_data = city_index[city]
 
     # Scale the data for comparison
     scaled_data = pd.DataFrame(scaler.fit_transform(city_data[['case_total'] + features]),
@@ -977,8 +886,8 @@ scaler = MinMaxScaler()
 
 # Loop through each city
 for city in cities:
-    # Filter the dataframe for the specific city
-    city_data = lepto_df[lepto_df['adm3_en'] == city]
+    # Slice the dataframe for the specific city
+    city_data = city_index[city]
 
     # Scale the data for comparison
     scaled_data = pd.DataFrame(scaler.fit_transform(city_data[['case_total'] + features]),
@@ -76,13 +76,25 @@ import shap
 from flask import Flask
 import streamlit as st
 
+# per-city data access and binary snapshots of the cleaned data
+from lepto_data import CityIndex
+from lepto_snapshot import read_lepto_table
+from lepto_features import load_features
+
 # mount gdrive
 from google.colab import drive
 drive.mount('/content/drive')
 
-lepto_df = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
+lepto_df = read_lepto_table('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
 lepto_df.head()
 
+# Same-week values plus lagged climate, rolling rainfall/humidity/heat index and lagged cases,
+# built once and cached on disk for this data version and window config
+features = load_features('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
+
+# Sort once by city and date so each city is a contiguous slice (weeks without a full lag history are left out)
+city_index = CityIndex(features.dropna())
+
 """# Linear Regression
 
 Sample Interpretation:
@@ -110,8 +122,8 @@ cities = lepto_df['adm3_en'].unique()
 
 # Loop over each city
 for city in cities:
-    # Filter data for the current city
-    city_data = lepto_df[lepto_df['adm3_en'] == city].copy()
+    # Slice the data for the current city
+    city_data = city_index[city].copy()
 
     # Drop the 'date' and 'adm3_en' columns
     city_data.drop(columns=['date', 'adm3_en'], inplace=True)
@@ -195,7 +207,7 @@ for city, results_df in sorted_cities:
 
 """# Binary Classification"""
 
-lepto_df = pd.read_csv('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
+lepto_df = read_lepto_table('/content/drive/MyDrive/Leptospirosis CCHAIN/lepto_dfclean.csv')
 lepto_df.head()
 
 lepto_df['case_total'] = lepto_df['case_total'].apply(lambda x: x > 0)
@@ -203,6 +215,10 @@ lepto_df = lepto_df
 # This will convert the 'case_total' to True if the value is greater than 0, otherwise False
 lepto_df.head()
 
+# Rebuild the city index on the converted target (the lagged case counts stay numeric)
+features['case_total'] = features['case_total'] > 0
+city_index = CityIndex(features.dropna())
+
 # Count the occurrences of cases with and without cases
 case_counts = lepto_df['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
 
@@ -293,8 +309,8 @@ for city in sorted_cities:
     # Retrieve the case_total for the current city
     case_total = total_sorted.loc[total_sorted['adm3_en'] == city, 'case_total'].values[0]
 
-    # Filter data for the current city
-    city_data = lepto_df[lepto_df['adm3_en'] == city].copy()
+    # Slice the data for the current city
+    city_data = city_index[city].copy()
 
     # Count the occurrences of cases with and without cases for the current city
     case_counts = city_data['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
@@ -306,7 +322,7 @@ for city in sorted_cities:
 
     # Split the data into features (X) and target (y)
     X = city_data
-    y = lepto_df.loc[lepto_df['adm3_en'] == city, 'case_total']
+    y = city_index[city]['case_total']
 
     # Stratified Train/Test Split
     X_train, X_test, y_train, y_test = train_test_split(X, y,
@@ -387,7 +403,7 @@ for city in sorted_cities:
     results_df = city_results[city]
 
     # Retrieve the counts for the current city
-    case_counts = lepto_df[lepto_df['adm3_en'] == city]['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
+    case_counts = city_index[city]['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
     with_case_count = case_counts.get('With Case', 0)
     without_case_count = case_counts.get('Without Case', 0)
 
@@ -419,8 +435,8 @@ for city in top_5_cities:
     # Retrieve the case_total for the current city
     case_total = total_sorted.loc[total_sorted['adm3_en'] == city, 'case_total'].values[0]
 
-    # Filter data for the current city
-    city_data = lepto_df[lepto_df['adm3_en'] == city].copy()
+    # Slice the data for the current city
+    city_data = city_index[city].copy()
 
     # Count the occurrences of cases with and without cases for the current city
     case_counts = city_data['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
@@ -432,7 +448,7 @@ for city in top_5_cities:
 
     # Split the data into features (X) and target (y)
     X = city_data
-    y = lepto_df.loc[lepto_df['adm3_en'] == city, 'case_total']
+    y = city_index[city]['case_total']
 
     # Stratified Train/Test Split
     X_train, X_test, y_train, y_test = train_test_split(X, y,
@@ -513,7 +529,7 @@ for city in top_5_cities:
     results_df = city_results[city]
 
     # Retrieve the counts for the current city
-    case_counts = lepto_df[lepto_df['adm3_en'] == city]['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
+    case_counts = city_index[city]['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
     with_case_count = case_counts.get('With Case', 0)
     without_case_count = case_counts.get('Without Case', 0)
 
@@ -552,8 +568,8 @@ for city in top_5_cities:
     # Retrieve the case_total for the current city
     case_total = total_sorted.loc[total_sorted['adm3_en'] == city, 'case_total'].values[0]
 
-    # Filter data for the current city
-    city_data = lepto_df[lepto_df['adm3_en'] == city].copy()
+    # Slice the data for the current city
+    city_data = city_index[city].copy()
 
     # Count the occurrences of cases with and without cases for the current city
     case_counts = city_data['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
@@ -565,7 +581,7 @@ for city in top_5_cities:
 
     # Split the data into features (X) and target (y)
     X = city_data
-    y = lepto_df.loc[lepto_df['adm3_en'] == city, 'case_total']
+    y = city_index[city]['case_total']
 
     # Stratified Train/Test Split
     X_train, X_test, y_train, y_test = train_test_split(X, y,
@@ -646,7 +662,7 @@ for city in top_5_cities:
     results_df = city_results[city]
 
     # Retrieve the counts for the current city
-    case_counts = lepto_df[lepto_df['adm3_en'] == city]['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
+    case_counts = city_index[city]['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
     with_case_count = case_counts.get('With Case', 0)
     without_case_count = case_counts.get('Without Case', 0)
 
@@ -694,7 +710,7 @@ for city in top_5_cities:
     results_df = city_results[city]
 
     # Retrieve the counts for the current city
-    case_counts = lepto_df[lepto_df['adm3_en'] == city]['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
+    case_counts = city_index[city]['case_total'].apply(lambda x: 'With Case' if x > 0 else 'Without Case').value_counts()
     with_case_count = case_counts.get('With Case', 0)
     without_case_count = case_counts.get('Without Case', 0)
 
@@ -795,8 +811,8 @@ for index, row in summary_df.iterrows():
     city = row['City']
     best_model_name = row['Best Model']
 
-    # Filter data for the current city
-    city_data = lepto_df[lepto_df['adm3_en'] == city].copy()
+    # Slice the data for the current city
+    city_data = city_index[city].copy()
 
     # Drop the 'date', 'adm3_en', and 'case_total' columns
     X = city_data.drop(columns=['date', 'adm3_en', 'case_total'])
@@ -900,7 +916,7 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
 
 # Filter data for Iloilo
-iloilo_data = lepto_df[lepto_df['adm3_en'] == 'Iloilo'].copy()
+iloilo_data = city_index.get('Iloilo').copy()
 
 # Check if there's data available for Iloilo
 if iloilo_data.shape[0] == 0:
@@ -973,10 +989,11 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
 
 # Convert 'case_total' to True if greater than 0, otherwise False
-lepto_df['case_total'] = lepto_df['case_total'].apply(lambda x: x > 0)
+features['case_total'] = features['case_total'] > 0
+city_index = CityIndex(features.dropna())
 
 # Filter data for Cagayan de Oro
-cdo_data = lepto_df[lepto_df['adm3_en'] == 'Cagayan de Oro'].copy()
+cdo_data = city_index.get('Cagayan de Oro').copy()
 
 # Check if there's data available for Cagayan de Oro
 if cdo_data.shape[0] == 0:
@@ -1045,7 +1062,7 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
 
 # Filter data for Navotas
-navotas_data = lepto_df[lepto_df['adm3_en'] == 'Navotas'].copy()
+navotas_data = city_index.get('Navotas').copy()
 
 # Check if there's data available for Navotas
 if navotas_data.shape[0] == 0:
@@ -0,0 +1,209 @@
+"""Rendered chart cache for the City Insights page.
+
+The charts only depend on the city, the chart type and the selected
+risk-factor feature, so each combination is rendered to PNG once and kept
+in a bounded LRU cache shared by every session in the process.
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from lepto_data import DATA_PATH, dataset_version
+from lepto_aggregates import OVERLAY_FEATURES, MONTH_NAMES, load_city_cube, min_max_scale
+
+# Matplotlib's color scheme for the app's plots
+CHART_STYLE = {
+    'axes.facecolor': 'white',
+    'axes.edgecolor': '#3d3d3d',
+    'axes.labelcolor': 'gray',
+    'xtick.color': 'gray',
+    'ytick.color': 'gray',
+    'text.color': '#19535b',
+    'figure.facecolor': 'white',
+    'figure.edgecolor': 'white',
+    'grid.color': '#3d3d3d',
+    'lines.color': '#19535b',
+    'axes.titlecolor': 'gray',
+}
+
+# Uniform figure size and the PNG settings st.pyplot would use
+FIG_SIZE = (4, 4)
+SAVEFIG_OPTIONS = {'format': 'png', 'dpi': 200, 'bbox_inches': 'tight'}
+
+# Charts that only depend on the city; 'overlay' also depends on the feature
+CITY_CHARTS = ['yearly', 'monthly', 'weekly']
+CHARTS = CITY_CHARTS + ['overlay']
+
+# Maximum number of rendered charts kept in memory (12 cities x 6 charts by default)
+CACHE_SIZE = int(os.environ.get('LEPTO_CHART_CACHE_SIZE', 72))
+
+# Matplotlib is not thread-safe, so renders are serialized
+_render_lock = threading.Lock()
+
+
+def _yearly_chart(ax, city_aggs):
+    # Visualization 1: Total Number of Cases per Year (2008-2020)
+    yearly_cases = city_aggs['yearly']
+    max_year = city_aggs['max_year']
+
+    # Color the bars based on whether they are the maximum year or not
+    bar_colors = ['#19535b' if year == max_year else '#d9d9d9' for year in yearly_cases['year']]
+
+    ax.bar(yearly_cases['year'], yearly_cases['case_total'], color=bar_colors)
+    ax.set_xticks(range(2008, 2021))
+    ax.set_xticklabels([str(year)[-2:] for year in range(2008, 2021)], fontsize=8)
+    ax.set_title('Total Cases Per Year (2008-2020)', fontsize=14, color='gray')
+
+
+def _monthly_chart(ax, city_aggs):
+    # Visualization 2: Average Monthly Cases
+    monthly_avg = city_aggs['monthly_avg']
+
+    ax.plot(monthly_avg['month'], monthly_avg['case_total'], marker='o', color='#d9d9d9', markersize=6)
+    ax.set_xticks(range(1, 13))
+    ax.set_xticklabels(MONTH_NAMES, fontsize=8)
+    ax.set_title('Average Monthly Cases', fontsize=14, color='gray')
+
+    # Highlighting the top 3 months
+    for _, row in city_aggs['top_months'].iterrows():
+        ax.plot(row['month'], row['case_total'], marker='o', color='#19535b', markersize=6)
+        month_abbr = MONTH_NAMES[int(row['month']) - 1]
+        ax.text(row['month'] + 0.4, row['case_total'], month_abbr, color='#19535b', ha='left', fontsize=8)
+
+
+def _weekly_chart(ax, city_aggs):
+    # Visualization 3: Weeks with Cases vs. Weeks without Cases
+    counts = [city_aggs['with_case_count'], city_aggs['without_case_count']]
+    ax.bar(['With Cases', 'Without Cases'], counts, color=['#19535b', '#d9d9d9'])
+    ax.set_title('No. of Weeks With/Without Cases', fontsize=14, color='gray')
+
+
+def _overlay_chart(ax, city_aggs, feature):
+    # Visualization 4: Overlay Selected Feature with Monthly Aggregation
+    monthly_avg = city_aggs['monthly_avg']
+
+    # Scaling the features to overlay on the same scale
+    scaled_feature = min_max_scale(monthly_avg[feature])
+    scaled_cases = min_max_scale(monthly_avg['case_total'])
+
+    # Plotting case total and the selected feature
+    ax.plot(monthly_avg['month'], scaled_cases, marker='o', label='Case Total', color='#d9d9d9', markersize=6)
+    ax.plot(monthly_avg['month'], scaled_feature, marker='o', label=feature.replace('_', ' ').title(), color='#19535b', markersize=4)
+
+    # Setting up x-axis labels and title
+    ax.set_xticks(range(1, 13))
+    ax.set_xticklabels(MONTH_NAMES, fontsize=8)
+    ax.set_title(f'Cases vs {feature.replace("_", " ").title()}', fontsize=10, color='gray')
+    ax.legend(fontsize=8)
+
+
+_CHART_BUILDERS = {
+    'yearly': _yearly_chart,
+    'monthly': _monthly_chart,
+    'weekly': _weekly_chart,
+    'overlay': _overlay_chart,
+}
+
+
+def render_chart(city_aggs, chart, feature=None):
+    # Render one chart to PNG bytes without touching pyplot's global figure list.
+    # Matplotlib is imported here so the app only pays for it on the first cache miss.
+    from matplotlib import rc_context
+    from matplotlib.figure import Figure
+
+    with _render_lock, rc_context(CHART_STYLE):
+        fig = Figure(figsize=FIG_SIZE)
+        ax = fig.subplots()
+        if chart == 'overlay':
+            _CHART_BUILDERS[chart](ax, city_aggs, feature)
+        else:
+            _CHART_BUILDERS[chart](ax, city_aggs)
+
+        image = io.BytesIO()
+        fig.savefig(image, **SAVEFIG_OPTIONS)
+        return image.getvalue()
+
+
+class ChartCache:
+    # Thread-safe LRU cache of rendered PNGs
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return self._images[key]
+            self.misses += 1
+
+        image = render()
+
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.maxsize:
+                self._images.popitem(last=False)
+        return image
+
+    def __len__(self):
+        return len(self._images)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._images
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+chart_cache = ChartCache()
+
+
+def _chart_key(city, chart, feature, path):
+    return (dataset_version(path), city, chart, feature if chart == 'overlay' else None)
+
+
+def get_chart(city, chart, feature=None, path=DATA_PATH):
+    # PNG for (city, chart, feature), rendered on first use
+    city_cube = load_city_cube(path)
+    key = _chart_key(city, chart, feature, path)
+    return chart_cache.get(key, lambda: render_chart(city_cube[city], chart, key[3]))
+
+
+def is_cached(city, chart, feature=None, path=DATA_PATH):
+    # Whether get_chart would be served from the cache
+    return _chart_key(city, chart, feature, path) in chart_cache
+
+
+def prewarm(path=DATA_PATH, features=OVERLAY_FEATURES):
+    # Render every city/chart/feature combination into the cache
+    for city in load_city_cube(path):
+        for chart in CITY_CHARTS:
+            get_chart(city, chart, path=path)
+        for feature in features:
+            get_chart(city, 'overlay', feature, path=path)
+
+
+_prewarm_started = False
+_prewarm_lock = threading.Lock()
+
+
+def start_prewarm(path=DATA_PATH):
+    # Pre-warm the cache once per process in a background thread
+    global _prewarm_started
+    with _prewarm_lock:
+        if _prewarm_started:
+            return
+        _prewarm_started = True
+    threading.Thread(target=prewarm, args=(path,), name='lepto-chart-prewarm', daemon=True).start()
@@ -0,0 +1,178 @@
+"""Lagged correlations between weekly cases and the climate features.
+
+    python lepto_correlation.py --max-lag 8
+    python lepto_correlation.py --method spearman --max-lag 12 --out lag_correlations.csv
+
+For every city, feature and lag k = 0..max_lag weeks, a week's case_total is
+correlated with the feature k weeks earlier (so a positive lag means the
+feature leads the cases). Every city, feature and lag is computed at once on
+arrays of shape city x feature x lag x week. Cities are processed in blocks
+so that memory stays bounded on large inputs. Missing weeks are excluded
+pairwise. Spearman ranks (average ranks for ties) are taken over exactly the
+weeks a pair has in common. Each entry therefore equals pandas'
+`cases.corr(feature.shift(k), method=...)` on the city's weekly series.
+"""
+
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from lepto_data import DATA_PATH, CLIMATE_COLUMNS, WeeklyPanel
+from lepto_snapshot import read_lepto_table
+
+LAG_FEATURES = ['pr', 'rh', 'tave', 'tmax', 'tmin', 'heat_index']
+DEFAULT_MAX_LAG = 8
+
+# Fewer common weeks than this gives NaN
+DEFAULT_MIN_PERIODS = 10
+
+# Upper bound on the elements of one city block (city x feature x lag x week)
+BLOCK_ELEMENTS = 2_000_000
+
+METHODS = ['pearson', 'spearman']
+
+
+def lag_windows(values, max_lag):
+    # values[..., t] -> windows[..., k, t] = values[..., t - k], NaN before the series starts
+    n_weeks = values.shape[-1]
+    padded = np.concatenate([np.full(values.shape[:-1] + (max_lag,), np.nan), values], axis=-1)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, n_weeks, axis=-1)
+    return windows[..., ::-1, :].copy()
+
+
+def average_ranks(values):
+    # Ranks 1..n along the last axis with ties sharing their average rank; NaN stays NaN
+    n = values.shape[-1]
+    order = np.argsort(values, axis=-1, kind='stable')
+    ordered = np.take_along_axis(values, order, axis=-1)
+    positions = np.broadcast_to(np.arange(1, n + 1, dtype='float64'), values.shape)
+
+    # A tie group starts where the sorted value changes and ends before the next start
+    starts = np.ones(values.shape, dtype=bool)
+    starts[..., 1:] = ordered[..., 1:] != ordered[..., :-1]
+    ends = np.ones(values.shape, dtype=bool)
+    ends[..., :-1] = starts[..., 1:]
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=-1)
+    last = np.minimum.accumulate(np.where(ends, positions, n + 1)[..., ::-1], axis=-1)[..., ::-1]
+
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2, axis=-1)
+    ranks[np.isnan(values)] = np.nan
+    return ranks
+
+
+def pairwise_pearson(x, y, min_periods=DEFAULT_MIN_PERIODS):
+    # Pearson r along the last axis over the positions where both are present; returns (r, n)
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    n = valid.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = np.where(valid, x, 0.0)
+        dx -= (dx.sum(axis=-1) / n)[..., None]
+        dx[~valid] = 0.0
+        dy = np.where(valid, y, 0.0)
+        dy -= (dy.sum(axis=-1) / n)[..., None]
+        dy[~valid] = 0.0
+        sxx = np.einsum('...t,...t->...', dx, dx)
+        syy = np.einsum('...t,...t->...', dy, dy)
+        r = np.einsum('...t,...t->...', dx, dy) / np.sqrt(sxx * syy)
+    r = np.where((n >= max(min_periods, 2)) & (sxx > 0) & (syy > 0), np.clip(r, -1.0, 1.0), np.nan)
+    return r, n
+
+
+def _block_correlations(cases, features, max_lag, method, min_periods):
+    # cases: city x week, features: city x feature x week -> (r, n), each city x feature x lag
+    x = lag_windows(features, max_lag)
+    y = cases[:, None, None, :]
+    if method == 'spearman':
+        valid = ~np.isnan(x) & ~np.isnan(y)
+        x = average_ranks(np.where(valid, x, np.nan))
+        y = average_ranks(np.where(valid, y, np.nan))
+    return pairwise_pearson(x, y, min_periods)
+
+
+class LagCorrelations:
+    # Correlation cube (city x feature x lag) with the number of weeks behind each entry
+
+    def __init__(self, values, counts, cities, features, lags, method):
+        self.values = values
+        self.counts = counts
+        self.cities = list(cities)
+        self.features = list(features)
+        self.lags = np.asarray(lags)
+        self.method = method
+
+    def __getitem__(self, key):
+        # cube[city] -> feature x lag frame, cube[city, feature] -> Series over the lags
+        city, feature = key if isinstance(key, tuple) else (key, None)
+        frame = pd.DataFrame(self.values[self.cities.index(city)], index=self.features,
+                             columns=pd.Index(self.lags, name='lag'))
+        return frame if feature is None else frame.loc[feature]
+
+    def to_frame(self):
+        # Long table: one row per city, feature and lag
+        n_cities, n_features, n_lags = self.values.shape
+        return pd.DataFrame({
+            'adm3_en': np.repeat(self.cities, n_features * n_lags),
+            'feature': np.tile(np.repeat(self.features, n_lags), n_cities),
+            'lag': np.tile(self.lags, n_cities * n_features),
+            self.method: self.values.ravel(),
+            'weeks': self.counts.ravel(),
+        })
+
+    def strongest(self):
+        # Lag with the largest |r| per city and feature
+        magnitude = np.where(np.isnan(self.values), -1.0, np.abs(self.values))
+        best = magnitude.argmax(axis=-1)
+        values = np.take_along_axis(self.values, best[..., None], axis=-1)[..., 0]
+        counts = np.take_along_axis(self.counts, best[..., None], axis=-1)[..., 0]
+        n_cities, n_features = best.shape
+        return pd.DataFrame({
+            'adm3_en': np.repeat(self.cities, n_features),
+            'feature': np.tile(self.features, n_cities),
+            'lag': self.lags[best].ravel(),
+            self.method: values.ravel(),
+            'weeks': counts.ravel(),
+        })
+
+
+def lagged_correlations(lepto_df, features=LAG_FEATURES, max_lag=DEFAULT_MAX_LAG, method='pearson',
+                        min_periods=DEFAULT_MIN_PERIODS):
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    features = list(features)
+    panel = WeeklyPanel(lepto_df, ['case_total'] + features)
+    cases, feature_values = panel['case_total'], panel.stack(features)
+
+    n_cities, n_weeks = cases.shape
+    shape = (n_cities, len(features), max_lag + 1)
+    values, counts = np.full(shape, np.nan), np.zeros(shape, dtype='int64')
+    block = max(1, BLOCK_ELEMENTS // max(1, len(features) * (max_lag + 1) * n_weeks))
+    for start in range(0, n_cities, block):
+        rows = slice(start, start + block)
+        values[rows], counts[rows] = _block_correlations(cases[rows], feature_values[rows], max_lag, method, min_periods)
+    return LagCorrelations(values, counts, panel.cities, features, np.arange(max_lag + 1), method)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lagged correlations between weekly cases and climate features.")
+    parser.add_argument('--data', default=DATA_PATH, help="path to lepto_dfclean.csv")
+    parser.add_argument('--max-lag', type=int, default=DEFAULT_MAX_LAG, help="largest lag in weeks")
+    parser.add_argument('--method', choices=METHODS, default='pearson')
+    parser.add_argument('--features', nargs='+', choices=CLIMATE_COLUMNS, default=LAG_FEATURES)
+    parser.add_argument('--min-periods', type=int, default=DEFAULT_MIN_PERIODS, help="fewest common weeks per entry")
+    parser.add_argument('--out', default=None, help="write every city/feature/lag to this CSV")
+    args = parser.parse_args()
+
+    lepto_df = read_lepto_table(args.data, columns=['date', 'adm3_en', 'case_total'] + args.features)
+    cube = lagged_correlations(lepto_df, args.features, args.max_lag, args.method, args.min_periods)
+    if args.out:
+        cube.to_frame().to_csv(args.out, index=False)
+    print(f"Strongest lag per city and feature ({args.method}, lags 0-{args.max_lag} weeks):")
+    print(cube.strongest().to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
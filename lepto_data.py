@@ -0,0 +1,353 @@
+"""Shared data-access layer for the LeptoShield app and notebooks.
+
+Parsed datasets are kept in a process-wide cache so that every Streamlit
+session (and every rerun of a session) reuses the same frame. The cache is
+only invalidated when the file on disk actually changes; when rows were only
+appended to it, just the new rows are parsed.
+"""
+
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from lepto_snapshot import file_hash, read_lepto_table
+
+# Default locations of the cleaned datasets (relative to the app directory)
+DATA_PATH = 'lepto_dfclean.csv'
+SUMMARY_PATH = 'city_summary.csv'
+
+# Weekly measurements
+CLIMATE_COLUMNS = ['heat_index', 'pr', 'rh', 'tave', 'tmax', 'tmin']
+
+# Static attributes: NOAH flood hazards are constant per city, population per city-year
+HAZARD_COLUMNS = [
+    'pct_area_flood_hazard_100yr_low', 'pct_area_flood_hazard_100yr_med', 'pct_area_flood_hazard_100yr_high',
+    'pct_area_flood_hazard_25yr_low', 'pct_area_flood_hazard_25yr_med', 'pct_area_flood_hazard_25yr_high',
+    'pct_area_flood_hazard_5yr_low', 'pct_area_flood_hazard_5yr_med', 'pct_area_flood_hazard_5yr_high'
+]
+POPULATION_COLUMNS = ['pop_count_total', 'pop_density']
+
+# Compact dtypes for lepto_dfclean.csv (float32 keeps ~7 significant digits, enough for these measurements)
+CSV_DTYPES = {
+    'adm3_en': 'category',
+    'case_total': 'int32',
+    **{col: 'float32' for col in CLIMATE_COLUMNS + HAZARD_COLUMNS + POPULATION_COLUMNS},
+}
+
+
+
+def widen_float32(values):
+    # float64 of float32 values through their shortest decimal repr, as str() prints them
+    # (float32 78.4 -> 78.4 rather than 78.40000152587891): the CSV digits the compact dtype kept.
+    # Tries 1..9 significant digits and keeps the first that reads back as the same float32.
+    values = np.asarray(values, dtype='float32')
+    wide = values.astype('float64')
+    out = wide.copy()
+    todo = np.isfinite(wide) & (wide != 0)
+    magnitude = np.floor(np.log10(np.abs(np.where(todo, wide, 1.0))))
+    for digits in range(1, 10):
+        scale = 10.0 ** (digits - 1 - magnitude)
+        rounded = np.round(wide * scale) / scale
+        found = todo & (rounded.astype('float32') == values)
+        out[found] = rounded[found]
+        todo &= ~found
+    return out
+
+
+# Process-wide cache: path -> {'stat': ..., 'hash': ..., 'data': ...}
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Loads served from the cache, loads that had to parse the file and loads that only parsed appended rows
+cache_stats = {'hits': 0, 'misses': 0, 'appends': 0}
+
+# Structures derived from a cached dataset: (path, name) -> (dataset token, result)
+_derived = {}
+_derived_lock = threading.Lock()
+
+
+def _file_stat(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _enrich(lepto_df):
+    # Calendar columns used by every chart in the app
+    # Same resolution whether the dates came from the CSV or the binary snapshot
+    lepto_df['date'] = pd.to_datetime(lepto_df['date']).astype('datetime64[ns]')
+    lepto_df['month'] = lepto_df['date'].dt.month.astype('int8')
+    lepto_df['year'] = lepto_df['date'].dt.year.astype('int16')
+    lepto_df['week'] = lepto_df['date'].dt.isocalendar().week.astype('int8')
+    return lepto_df
+
+
+def _add_missing(table, added):
+    # `table` plus the rows of `added` whose index is not in it yet
+    new_rows = added[~added.index.isin(table.index)]
+    return table if new_rows.empty else pd.concat([table, new_rows.astype(table.dtypes.to_dict())])
+
+
+class CompactDataset:
+    # Weekly facts plus the static attributes factored out into dimension tables:
+    #   facts      - one row per city-week: date, adm3_en, case_total, climate, calendar columns
+    #   cities     - one row per city: flood hazard percentages
+    #   city_years - one row per city and year: population count and density
+    # join_static() rebuilds the wide lepto_dfclean layout on demand.
+
+    def __init__(self, lepto_df):
+        static_columns = [col for col in HAZARD_COLUMNS + POPULATION_COLUMNS if col in lepto_df.columns]
+        self.columns = [col for col in lepto_df.columns if col not in ('month', 'year', 'week')]
+
+        hazard_columns = [col for col in HAZARD_COLUMNS if col in lepto_df.columns]
+        population_columns = [col for col in POPULATION_COLUMNS if col in lepto_df.columns]
+        self.cities = lepto_df.groupby('adm3_en', observed=True)[hazard_columns].first()
+        self.city_years = lepto_df.groupby(['adm3_en', 'year'], observed=True)[population_columns].first()
+        self.facts = lepto_df.drop(columns=static_columns)
+
+        # Identity of this version of the data; an appended dataset remembers the version it extends
+        self.token = object()
+        self.base_token = None
+        self.appended = None
+
+    def append(self, lepto_df):
+        # New dataset with the (typed, enriched) wide rows of `lepto_df` added after the
+        # existing ones. The existing dataset is shared between sessions and left untouched.
+        added = CompactDataset(lepto_df)
+        dataset = CompactDataset.__new__(CompactDataset)
+        dataset.columns = self.columns
+
+        # Existing static attributes win; only new cities and city-years are added
+        dataset.cities = _add_missing(self.cities, added.cities)
+        dataset.city_years = _add_missing(self.city_years, added.city_years)
+
+        # Extend the city categories instead of letting concat fall back to object
+        facts, new_facts = self.facts, added.facts
+        if isinstance(facts['adm3_en'].dtype, pd.CategoricalDtype):
+            new_cities = [city for city in pd.unique(new_facts['adm3_en'].astype(str)) if city not in facts['adm3_en'].cat.categories]
+            categories = facts['adm3_en'].cat.categories.append(pd.Index(new_cities, dtype=facts['adm3_en'].cat.categories.dtype))
+            facts = facts.assign(adm3_en=facts['adm3_en'].cat.set_categories(categories))
+            new_facts = new_facts.assign(adm3_en=pd.Categorical(new_facts['adm3_en'].astype(str), categories=categories))
+        dataset.facts = pd.concat([facts, new_facts], ignore_index=True)
+
+        dataset.token = object()
+        dataset.base_token = self.token
+        dataset.appended = dataset.facts.iloc[len(facts):]
+        return dataset
+
+    def join_static(self, columns=None, facts=None):
+        # Facts joined with the requested static columns (all of them by default)
+        facts = self.facts if facts is None else facts
+        columns = HAZARD_COLUMNS + POPULATION_COLUMNS if columns is None else columns
+
+        wide = facts
+        hazard_columns = [col for col in columns if col in self.cities.columns]
+        if hazard_columns:
+            wide = wide.join(self.cities[hazard_columns], on='adm3_en')
+        population_columns = [col for col in columns if col in self.city_years.columns]
+        if population_columns:
+            wide = wide.join(self.city_years[population_columns], on=['adm3_en', 'year'])
+
+        ordered = [col for col in self.columns if col in wide.columns]
+        return wide[ordered + [col for col in wide.columns if col not in ordered]]
+
+    def memory_usage(self):
+        # Bytes held by the fact and dimension tables
+        return int(sum(frame.memory_usage(deep=True).sum() for frame in (self.facts, self.cities, self.city_years)))
+
+
+def read_lepto_csv(path, source_hash=None):
+    # Typed load of lepto_dfclean.csv: categorical cities, int32 cases, float32 measurements.
+    # Reads the binary snapshot when it is up to date and writes one after a CSV parse.
+    lepto_df = read_lepto_table(path, source_hash=source_hash, write_through=True)
+    lepto_df = lepto_df.astype({col: dtype for col, dtype in CSV_DTYPES.items() if col in lepto_df.columns})
+    return _enrich(lepto_df)
+
+
+def read_appended_rows(path, offset, columns):
+    # Rows written after the first `offset` bytes of a CSV, typed like read_lepto_csv.
+    # None if the tail does not start and end on a line boundary.
+    with open(path, 'rb') as f:
+        f.seek(max(offset - 1, 0))
+        tail = f.read()
+    if offset == 0 or not tail.startswith(b'\n') or not tail.endswith(b'\n'):
+        return None
+    rows = pd.read_csv(io.BytesIO(tail[1:]), header=None, names=columns)
+    rows = rows.astype({col: dtype for col, dtype in CSV_DTYPES.items() if col in rows.columns and col != 'adm3_en'})
+    return _enrich(rows)
+
+
+def _append_lepto_csv(dataset, path, offset):
+    rows = read_appended_rows(path, offset, dataset.columns)
+    return None if rows is None else dataset.append(rows)
+
+
+def _cached_load(path, loader, kind='raw', appender=None):
+    path = os.path.abspath(path)
+    stat = _file_stat(path)
+
+    with _cache_lock:
+        entry = _cache.get((path, kind))
+
+        # Fast path: file untouched since the last parse
+        if entry is not None and entry['stat'] == stat:
+            cache_stats['hits'] += 1
+            return entry['data']
+
+        # The mtime moved; only re-parse if the content really changed
+        content_hash = file_hash(path)
+        if entry is not None and entry['hash'] == content_hash:
+            entry['stat'] = stat
+            cache_stats['hits'] += 1
+            return entry['data']
+
+        # Rows were only appended (the old content is an unchanged prefix): parse just the new rows
+        if entry is not None and appender is not None and stat[1] > entry['stat'][1] \
+                and file_hash(path, limit=entry['stat'][1]) == entry['hash']:
+            data = appender(entry['data'], path, entry['stat'][1])
+            if data is not None:
+                cache_stats['appends'] += 1
+                _cache[(path, kind)] = {'stat': stat, 'hash': content_hash, 'data': data}
+                return data
+
+        cache_stats['misses'] += 1
+        data = loader(path, content_hash)
+        _cache[(path, kind)] = {'stat': stat, 'hash': content_hash, 'data': data}
+        return data
+
+
+def load_lepto_dataset(path=DATA_PATH):
+    # Compact dataset (facts + static dimension tables), shared between sessions: treat as read-only
+    return _cached_load(path, lambda p, h: CompactDataset(read_lepto_csv(p, h)), kind='compact', appender=_append_lepto_csv)
+
+
+def load_lepto_df(path=DATA_PATH):
+    # Weekly facts (cases, climate and date/month/year/week columns) of the compact dataset.
+    # Static hazard/population columns are available via load_lepto_dataset(path).join_static().
+    # The returned frame is shared between sessions: treat it as read-only.
+    return load_lepto_dataset(path).facts
+
+
+def load_city_summary(path=SUMMARY_PATH):
+    # Per-city totals (area, population, density, cases); shared and read-only
+    return _cached_load(path, lambda p, h: read_lepto_table(p, source_hash=h, write_through=True), kind='summary')
+
+
+def derived(path, name, builder, updater=None):
+    # Memoize builder(lepto_df) for the cached dataset at `path`; rebuilt whenever it is re-parsed.
+    # After an append, updater(previous result, lepto_df, appended rows) is used instead if given.
+    dataset = load_lepto_dataset(path)
+    key = (os.path.abspath(path), name)
+    with _derived_lock:
+        entry = _derived.get(key)
+        if entry is None or entry[0] is not dataset.token:
+            if updater is not None and entry is not None and entry[0] is dataset.base_token:
+                result = updater(entry[1], dataset.facts, dataset.appended)
+            else:
+                result = builder(dataset.facts)
+            entry = (dataset.token, result)
+            _derived[key] = entry
+        return entry[1]
+
+
+class CityIndex:
+    # Rows sorted once by city and date, with each city's rows stored as one
+    # contiguous block. Looking up a city is a positional slice instead of a
+    # string comparison over the whole frame.
+
+    def __init__(self, lepto_df, city_col='adm3_en', date_col='date'):
+        # `date_col` may also name the index (e.g. after set_index('date'))
+        self.frame = lepto_df.sort_values([city_col, date_col], kind='stable')
+
+        codes = self.frame[city_col].to_numpy()
+        if len(codes) == 0:
+            self.offsets = {}
+            return
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        stops = np.r_[starts[1:], len(codes)]
+        self.offsets = {codes[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+    @property
+    def cities(self):
+        return list(self.offsets)
+
+    def __contains__(self, city):
+        return city in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, city):
+        start, stop = self.offsets[city]
+        return self.frame.iloc[start:stop]
+
+    def get(self, city):
+        # Like [] but returns an empty frame for unknown cities
+        if city not in self.offsets:
+            return self.frame.iloc[0:0]
+        return self[city]
+
+    def __iter__(self):
+        for city in self.offsets:
+            yield city, self[city]
+
+
+def load_city_index(path=DATA_PATH):
+    return derived(path, 'city_index', CityIndex)
+
+
+class WeeklyPanel:
+    # Columns laid out as dense city x week arrays on a regular weekly calendar
+    # running from the first to the last week in the data. Weeks a city did not
+    # report are NaN, so neighbouring positions are always exactly 7 days apart.
+
+    def __init__(self, lepto_df, columns, city_col='adm3_en', date_col='date'):
+        codes, cities = pd.factorize(lepto_df[city_col].astype(str).to_numpy(), sort=True)
+        self.cities = list(cities)
+        dates = lepto_df[date_col].to_numpy().astype('datetime64[ns]')
+        if len(dates) == 0:
+            self.weeks = pd.DatetimeIndex([])
+            self.values = {col: np.empty((0, 0)) for col in columns}
+            self.row_cities = self.row_weeks = np.empty(0, dtype='int64')
+            return
+
+        start = dates.min()
+        positions = (dates - start) // np.timedelta64(7, 'D')
+        self.weeks = pd.date_range(start, periods=int(positions.max()) + 1, freq='7D')
+        # Where each input row sits in the panel
+        self.row_cities, self.row_weeks = codes, positions
+        self.values = {}
+        for col in columns:
+            values = np.full((len(self.cities), len(self.weeks)), np.nan)
+            values[codes, positions] = lepto_df[col].to_numpy(dtype='float64')
+            self.values[col] = values
+
+    def __getitem__(self, column):
+        return self.values[column]
+
+    def at_rows(self, values):
+        # Inverse of the layout: a city x week array read back in the input's row order
+        return values[self.row_cities, self.row_weeks]
+
+    def stack(self, columns):
+        # city x column x week
+        return np.stack([self.values[col] for col in columns], axis=1)
+
+
+def dataset_version(path=DATA_PATH):
+    # Content hash of the currently cached parse of a file (None if not loaded)
+    path = os.path.abspath(path)
+    for (cached_path, _), entry in list(_cache.items()):
+        if cached_path == path:
+            return entry['hash']
+    return None
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        cache_stats.update(hits=0, misses=0, appends=0)
+    with _derived_lock:
+        _derived.clear()
@@ -0,0 +1,559 @@
+"""Local ETL for the LeptoShield datasets.
+
+Rebuilds `lepto_dfclean.csv` and `city_summary.csv` from the Project CCHAIN
+extracts, following the "Feature Selection" and "Preprocessing" steps of
+lepto_cchain_eda.py:
+
+    python lepto_etl.py --input-dir data/raw --output-dir .
+    python lepto_etl.py --input-dir data/raw --start-year 2008 --end-year 2020
+
+The input directory holds brgy_geography.csv, location.csv, lepto_df.csv,
+project_noah_hazards.csv and worldpop_population.csv. Stage outputs are
+cached on disk by the content hash of their inputs and parameters, so a
+rerun only recomputes the stages downstream of a changed input (and is a
+no-op when nothing changed). Independent sources are parsed, and
+independent stages built, on a small thread pool (`--workers`), and only the
+columns the pipeline keeps are parsed. The cleaned table goes through the
+lepto_validate rules before anything is written; errors abort the run and
+`--report` saves the validation report as JSON.
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from lepto_data import CLIMATE_COLUMNS, HAZARD_COLUMNS
+from lepto_snapshot import file_hash, save_table
+from lepto_validate import validate_table, problems
+
+# Bump when a stage's logic changes so cached stage outputs are rebuilt
+ETL_VERSION = 2
+
+# Stage outputs cached between runs, inside the output directory by default
+CACHE_DIR = '.lepto_etl_cache'
+
+# Input files, by role
+SOURCE_FILES = {
+    'brgy': 'brgy_geography.csv',
+    'location': 'location.csv',
+    'lepto': 'lepto_df.csv',
+    'noah': 'project_noah_hazards.csv',
+    'population': 'worldpop_population.csv',
+}
+
+# Health & climate variables with low relevance to leptospirosis
+LEPTO_DROP_COLUMNS = ['wind_speed', 'solar_rad', 'uv_rad', 'co', 'no2', 'o3', 'pm10', 'pm25', 'so2', 'ndvi']
+NOAH_DROP_COLUMNS = ['uuid', 'freq', 'pct_area_landslide_hazard_low', 'pct_area_landslide_hazard_med', 'pct_area_landslide_hazard_high']
+POPULATION_DROP_COLUMNS = [
+    'uuid', 'freq', 'pop_count_mean', 'pop_count_median', 'pop_count_stdev', 'pop_count_min', 'pop_count_max',
+    'pop_density_mean', 'pop_density_median', 'pop_density_stdev', 'pop_density_min', 'pop_density_max'
+]
+
+# City areas (sq km) that the barangay sums get wrong
+AREA_OVERRIDES = {'PH137503000': 10.5395}
+
+# Columns the stages use from the fixed-layout sources
+KEEP_COLUMNS = {
+    'brgy': ['adm4_pcode', 'brgy_total_area'],
+    'location': ['adm4_pcode', 'adm3_pcode', 'adm3_en'],
+    'population': ['date', 'adm4_pcode', 'pop_count_total'],
+}
+
+# Columns never used from the other sources (NOAH hazards are static, so its date goes too)
+DROP_COLUMNS = {
+    'lepto': LEPTO_DROP_COLUMNS,
+    'noah': NOAH_DROP_COLUMNS + ['date'],
+}
+
+# Parse hints: codes, names and dates stay text, measurements are floats
+TEXT_COLUMNS = ['date', 'adm3_en', 'adm3_pcode', 'adm4_pcode']
+FLOAT_COLUMNS = CLIMATE_COLUMNS + HAZARD_COLUMNS + ['pop_count_total', 'brgy_total_area']
+
+# Sources streamed in chunks by their stage; the others are read whole
+STREAMED_ROLES = ['noah', 'population']
+
+# Rows per chunk when streaming the barangay-level sources
+CHUNK_ROWS = 100_000
+
+# Threads parsing sources and building independent stages (one core gains nothing from more)
+WORKERS = min(4, os.cpu_count() or 1)
+
+# Population data only covers these years
+START_YEAR = 2008
+END_YEAR = 2020
+
+# Prefixes/suffixes stripped from the city names, in order
+CITY_NAME_PATTERNS = ['^City of ', '^City ', ' City$']
+
+
+def source_columns(path, role):
+    # Columns of a source the pipeline keeps, with parse hints; the rest are never parsed
+    header = pd.read_csv(path, nrows=0).columns
+    if role in KEEP_COLUMNS:
+        usecols = [col for col in header if col in KEEP_COLUMNS[role]]
+    else:
+        usecols = [col for col in header if col not in DROP_COLUMNS.get(role, ())]
+    dtype = {col: 'str' for col in usecols if col in TEXT_COLUMNS}
+    dtype.update({col: 'float64' for col in usecols if col in FLOAT_COLUMNS})
+    return usecols, dtype
+
+
+def read_source(input_dir, role):
+    path = os.path.join(input_dir, SOURCE_FILES[role])
+    usecols, dtype = source_columns(path, role)
+    return pd.read_csv(path, usecols=usecols, dtype=dtype)
+
+
+def read_source_chunks(input_dir, role, chunksize=CHUNK_ROWS):
+    # Stream a (barangay-level) source in chunks
+    path = os.path.join(input_dir, SOURCE_FILES[role])
+    usecols, dtype = source_columns(path, role)
+    return pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize)
+
+
+class SourceLoader:
+    # Whole-table sources parsed concurrently in the background as soon as a
+    # run knows it needs them; a stage then just picks up the parsed frame
+
+    def __init__(self, input_dir, executor):
+        self.input_dir = input_dir
+        self.executor = executor
+        self._futures = {}
+
+    def prefetch(self, roles):
+        for role in roles:
+            if role not in self._futures:
+                self._futures[role] = self.executor.submit(read_source, self.input_dir, role)
+
+    def read(self, role):
+        # A role that was not prefetched is read on the calling thread
+        future = self._futures.pop(role, None)
+        return future.result() if future is not None else read_source(self.input_dir, role)
+
+
+class GroupAccumulator:
+    # Running per-group sums and non-null counts over a stream of chunks, keyed
+    # by integer group codes: each chunk is a few bincounts, and memory is
+    # bounded by the number of groups rather than the number of rows
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.sums = np.zeros((0, len(self.columns)))
+        self.counts = np.zeros((0, len(self.columns)), dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int64)
+
+    def _grow(self, size):
+        if size > len(self.rows):
+            extra = size - len(self.rows)
+            self.sums = np.vstack([self.sums, np.zeros((extra, len(self.columns)))])
+            self.counts = np.vstack([self.counts, np.zeros((extra, len(self.columns)), dtype=np.int64)])
+            self.rows = np.concatenate([self.rows, np.zeros(extra, dtype=np.int64)])
+
+    def add(self, codes, values):
+        # codes: the group of each row (-1 for none, dropped); values: rows x columns
+        keep = codes >= 0
+        codes = codes[keep]
+        values = np.asarray(values, dtype=float)[keep]
+        if not len(codes):
+            return
+        self._grow(int(codes.max()) + 1)
+        size = len(self.rows)
+        present = ~np.isnan(values)
+        for j in range(len(self.columns)):
+            self.sums[:, j] += np.bincount(codes, weights=np.where(present[:, j], values[:, j], 0), minlength=size)
+            self.counts[:, j] += np.bincount(codes[present[:, j]], minlength=size)
+        self.rows += np.bincount(codes, minlength=size)
+
+    def groups(self):
+        # Codes of the groups that received rows
+        return np.flatnonzero(self.rows)
+
+    def sum(self):
+        groups = self.groups()
+        return groups, pd.DataFrame(self.sums[groups], columns=self.columns)
+
+    def mean(self):
+        groups = self.groups()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return groups, pd.DataFrame(self.sums[groups] / self.counts[groups], columns=self.columns)
+
+
+class GeoHierarchy:
+    # Barangay -> city -> city name, integer-encoded once and shared by every
+    # stage. A chunk's barangay codes are resolved with one index lookup; the
+    # rest is array indexing on small integer codes instead of string merges.
+
+    def __init__(self, location_map):
+        barangays = location_map.drop_duplicates('adm4_pcode')
+        self.adm4_pcode = pd.Index(barangays['adm4_pcode'])
+        # City code of each barangay, and the city pcodes/names by city code
+        self.city_of_brgy, adm3_pcode = pd.factorize(barangays['adm3_pcode'])
+        self.adm3_pcode = np.asarray(adm3_pcode, dtype=object)
+        # Barangays without a city pcode get code -1; they belong to no city and must not shift the names
+        self.adm3_en = (barangays.groupby(self.city_of_brgy)['adm3_en'].first()
+                        .reindex(range(len(adm3_pcode))).to_numpy(dtype=object))
+        self.brgy_area = barangays['brgy_total_area'].to_numpy(dtype=float)
+
+    def __len__(self):
+        return len(self.adm3_pcode)
+
+    def brgy_codes(self, adm4_pcode):
+        # Position of each barangay code, -1 when unknown
+        return self.adm4_pcode.get_indexer(adm4_pcode)
+
+    def city_codes(self, brgy_codes):
+        return np.where(brgy_codes >= 0, self.city_of_brgy[brgy_codes], -1)
+
+    def cities(self):
+        # One row per city with its name and pcode
+        return pd.DataFrame({'adm3_en': self.adm3_en, 'adm3_pcode': self.adm3_pcode})
+
+
+def clean_city_names(names):
+    # 'City of Iloilo' / 'Iloilo City' -> 'Iloilo'
+    for pattern in CITY_NAME_PATTERNS:
+        names = names.str.replace(pattern, '', regex=True)
+    return names
+
+
+def build_location_map(brgy, loc):
+    # One row per barangay with its city (adm3) codes and names; the area comes from the geography table
+    return pd.merge(brgy, loc.drop(columns=['brgy_total_area'], errors='ignore'), on='adm4_pcode')
+
+
+def build_geography(brgy, loc):
+    return GeoHierarchy(build_location_map(brgy, loc))
+
+
+def prepare_health_climate(lepto_df, geography):
+    # Weekly cases and climate per city, tagged with the city code
+    lepto_df = pd.merge(lepto_df, geography.cities(), on='adm3_en', how='left')
+    return lepto_df.drop(columns=[col for col in LEPTO_DROP_COLUMNS if col in lepto_df.columns])
+
+
+def _as_chunks(source):
+    # A whole DataFrame or an iterable of chunks (e.g. from read_source_chunks)
+    return [source] if isinstance(source, pd.DataFrame) else source
+
+
+def aggregate_noah(noah, geography):
+    # Flood hazards per city: simple average over the city's barangays.
+    # Barangays are mapped to their city chunk by chunk.
+    totals = None
+    for chunk in _as_chunks(noah):
+        chunk = chunk.drop(columns=[col for col in NOAH_DROP_COLUMNS + ['date'] if col in chunk.columns])
+        cities = geography.city_codes(geography.brgy_codes(chunk.pop('adm4_pcode')))
+        if totals is None:
+            totals = GroupAccumulator(chunk.columns)
+        totals.add(cities, chunk.to_numpy(dtype=float))
+    cities, noah_city = totals.mean()
+    noah_city.insert(0, 'adm3_pcode', geography.adm3_pcode[cities])
+    return noah_city.sort_values('adm3_pcode').reset_index(drop=True)
+
+
+def aggregate_population(pop, geography, area_overrides=AREA_OVERRIDES):
+    # Population per city and year: barangay counts and areas summed, density recomputed.
+    # Rows are grouped by (date, city) codes chunk by chunk.
+    dates = pd.Index([], dtype=object)
+    totals = GroupAccumulator(['pop_count_total', 'brgy_total_area'])
+    for chunk in _as_chunks(pop):
+        # Dates get stable codes across chunks as they are first seen
+        local_codes, chunk_dates = pd.factorize(chunk['date'])
+        dates = dates.append(pd.Index(chunk_dates, dtype=object).difference(dates))
+        date_codes = np.where(local_codes >= 0, dates.get_indexer(chunk_dates)[local_codes], -1)
+        brgys = geography.brgy_codes(chunk['adm4_pcode'])
+        cities = geography.city_codes(brgys)
+        codes = np.where((cities >= 0) & (date_codes >= 0), date_codes * len(geography) + cities, -1)
+        area = np.where(brgys >= 0, geography.brgy_area[brgys], np.nan)
+        totals.add(codes, np.column_stack([chunk['pop_count_total'].to_numpy(dtype=float), area]))
+
+    groups, pop_city = totals.sum()
+    pop_city.insert(0, 'date', np.asarray(dates, dtype=object)[groups // len(geography)])
+    pop_city.insert(1, 'adm3_pcode', geography.adm3_pcode[groups % len(geography)])
+    pop_city = pop_city.sort_values(['date', 'adm3_pcode']).reset_index(drop=True)
+
+    for adm3_pcode, area in area_overrides.items():
+        pop_city.loc[pop_city['adm3_pcode'] == adm3_pcode, 'brgy_total_area'] = area
+
+    pop_city = pop_city.rename(columns={'brgy_total_area': 'city_area'})
+    pop_city['pop_density'] = pop_city['pop_count_total'] / pop_city['city_area']
+    pop_city['year'] = pd.to_datetime(pop_city['date']).dt.year
+    return pop_city
+
+
+def merge_sources(lepto_df, noah_city, pop_city):
+    # Static hazards by city, population by city and year
+    lepto_df = pd.merge(lepto_df, noah_city, on='adm3_pcode', how='left')
+    lepto_df['year'] = pd.to_datetime(lepto_df['date']).dt.year
+    lepto_df = lepto_df.merge(pop_city[['year', 'adm3_pcode', 'pop_count_total', 'pop_density']],
+                              on=['year', 'adm3_pcode'], how='left')
+    return lepto_df.drop(columns=['year'])
+
+
+def clean(lepto_df, start_year=START_YEAR, end_year=END_YEAR):
+    # Drop duplicates, keep the years with population data and tidy the city names
+    lepto_df = lepto_df.drop_duplicates()
+    lepto_df = lepto_df.assign(date=pd.to_datetime(lepto_df['date'], errors='coerce'))
+    lepto_df = lepto_df[(lepto_df['date'].dt.year >= start_year) & (lepto_df['date'].dt.year <= end_year)]
+    return lepto_df.assign(adm3_en=clean_city_names(lepto_df['adm3_en']))
+
+
+def build_city_summary(lepto_df, pop_city):
+    # Per-city totals shown by the app: cases summed, population averaged over the weeks
+    summary = lepto_df.groupby('adm3_en').agg(
+        case_total=('case_total', 'sum'),
+        pop_count_total=('pop_count_total', 'mean'),
+        pop_density=('pop_density', 'mean'),
+        adm3_pcode=('adm3_pcode', 'first'),
+    ).reset_index()
+    city_area = pop_city.groupby('adm3_pcode')['city_area'].first()
+    summary['city_area'] = summary['adm3_pcode'].map(city_area)
+    summary = summary.drop(columns=['adm3_pcode'])
+    return summary.sort_values('case_total', ascending=False, kind='stable').reset_index(drop=True)
+
+
+class StageCache:
+    # On-disk cache of stage outputs. A stage's key hashes its code version,
+    # parameters, source file contents and upstream keys, so a changed input only
+    # invalidates the stages downstream of it.
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._sources_path = os.path.join(cache_dir, 'sources.json')
+        self._sources = self._read_json(self._sources_path)
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_json(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def source_hash(self, path):
+        # Content hash of a source file, re-hashed only when its size or mtime changes
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self._sources.get(path)
+        if entry is None or entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'hash': file_hash(path)}
+            self._sources[path] = entry
+            self._write_json(self._sources_path, self._sources)
+        return entry['hash']
+
+    @staticmethod
+    def key(stage, params, inputs):
+        payload = json.dumps({'stage': stage, 'version': ETL_VERSION, 'params': params, 'inputs': inputs}, sort_keys=True)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _path(self, stage, key):
+        return os.path.join(self.cache_dir, f'{stage}-{key}.pkl')
+
+    def load(self, stage, key):
+        # Cached output, or None when it is missing, truncated or written by an incompatible version
+        try:
+            return pd.read_pickle(self._path(stage, key))
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    def store(self, stage, key, result):
+        # Keep only the latest output of each stage
+        path = self._path(stage, key)
+        tmp_path = path + '.tmp'
+        pd.to_pickle(result, tmp_path)
+        os.replace(tmp_path, path)
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(f'{stage}-') and name.endswith('.pkl') and os.path.join(self.cache_dir, name) != path:
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def outputs_current(self, outputs):
+        # True if every output file was written from these stage keys and is untouched since
+        recorded = self._read_json(os.path.join(self.cache_dir, 'outputs.json'))
+        for path, key in outputs.items():
+            entry = recorded.get(os.path.abspath(path))
+            if entry is None or entry['key'] != key or not os.path.exists(path) or file_hash(path) != entry['hash']:
+                return False
+        return True
+
+    def record_outputs(self, outputs):
+        recorded = {os.path.abspath(path): {'key': key, 'hash': file_hash(path)} for path, key in outputs.items()}
+        self._write_json(os.path.join(self.cache_dir, 'outputs.json'), recorded)
+
+
+class ValidationError(ValueError):
+    # The cleaned table failed validation; `report` is the full report
+
+    def __init__(self, report):
+        super().__init__('; '.join(problems(report)))
+        self.report = report
+
+
+def pipeline_stages(input_dir, start_year=START_YEAR, end_year=END_YEAR, area_overrides=AREA_OVERRIDES, chunksize=CHUNK_ROWS,
+                    loader=None):
+    # stage -> (source roles, upstream stages, parameters, build(*upstream outputs)), in dependency order
+    def source(role):
+        return loader.read(role) if loader else read_source(input_dir, role)
+
+    def chunks(role):
+        # The barangay-level sources are streamed so they never need to fit in memory at once
+        return read_source_chunks(input_dir, role, chunksize)
+
+    return {
+        'geography': (['brgy', 'location'], [], {},
+                      lambda: build_geography(source('brgy'), source('location'))),
+        'health_climate': (['lepto'], ['geography'], {},
+                           lambda geography: prepare_health_climate(source('lepto'), geography)),
+        'noah': (['noah'], ['geography'], {},
+                 lambda geography: aggregate_noah(chunks('noah'), geography)),
+        'population': (['population'], ['geography'], {'area_overrides': area_overrides},
+                       lambda geography: aggregate_population(chunks('population'), geography, area_overrides)),
+        'merge': ([], ['health_climate', 'noah', 'population'], {}, merge_sources),
+        'clean': ([], ['merge'], {'start_year': start_year, 'end_year': end_year},
+                  lambda merged: clean(merged, start_year, end_year)),
+        'city_summary': ([], ['clean', 'population'], {}, build_city_summary),
+    }
+
+
+def stage_waves(stages, names):
+    # Group stages so each wave only depends on earlier waves; the stages of a wave are independent
+    depth = {}
+    for name, (_, upstream, _, _) in stages.items():
+        if name in names:
+            depth[name] = 1 + max((depth[stage] for stage in upstream if stage in depth), default=-1)
+    waves = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+    for name, level in depth.items():
+        waves[level].append(name)
+    return waves
+
+
+def run_pipeline(input_dir, output_dir='.', start_year=START_YEAR, end_year=END_YEAR, area_overrides=AREA_OVERRIDES,
+                 chunksize=CHUNK_ROWS, cache_dir=None, use_cache=True, report_path=None, workers=WORKERS):
+    # Build both datasets from the raw extracts and write them (with binary snapshots) to output_dir.
+    # Stages whose inputs are unchanged are loaded from the cache; returns {stage: {'seconds', 'cached'}}.
+    # Raises ValidationError, without writing anything, when the cleaned table has errors.
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='lepto-etl') as executor:
+        loader = SourceLoader(input_dir, executor)
+        stages = pipeline_stages(input_dir, start_year, end_year, area_overrides, chunksize, loader)
+        cache = StageCache(cache_dir or os.path.join(output_dir, CACHE_DIR)) if use_cache else None
+        report = {}
+
+        # Every stage key is known up front from the source hashes alone
+        keys = {}
+        for name, (roles, upstream, params, _) in stages.items():
+            inputs = [cache.source_hash(os.path.join(input_dir, SOURCE_FILES[role])) if cache else None for role in roles]
+            keys[name] = StageCache.key(name, params, inputs + [keys[stage] for stage in upstream])
+
+        outputs = {
+            os.path.join(output_dir, 'lepto_dfclean.csv'): keys['clean'],
+            os.path.join(output_dir, 'city_summary.csv'): keys['city_summary'],
+        }
+        if cache and cache.outputs_current(outputs):
+            return report
+
+        # Stages to build: the outputs and, below each one missing from the cache, its upstream stages.
+        # Every stage probed here is needed, so its cached output is loaded right away; an entry that
+        # does not load counts as missing.
+        to_build = set()
+        results = {}
+
+        def plan(name):
+            if name in to_build or name in results:
+                return
+            result = cache.load(name, keys[name]) if cache else None
+            if result is not None:
+                results[name] = result
+                report[name] = {'seconds': 0.0, 'cached': True}
+                return
+            to_build.add(name)
+            for stage in stages[name][1]:
+                plan(stage)
+
+        plan('clean')
+        plan('city_summary')
+        # Start parsing every whole-table source the build needs right away
+        loader.prefetch(role for name in stages if name in to_build for role in stages[name][0] if role not in STREAMED_ROLES)
+
+        def build_stage(name):
+            # Upstream stages are already in `results`: loaded while planning or built in an earlier wave
+            _, upstream, _, build = stages[name]
+            args = [results[stage] for stage in upstream]
+            start = time.perf_counter()
+            result = build(*args)
+            if cache:
+                cache.store(name, keys[name], result)
+            return result, time.perf_counter() - start
+
+        for wave in stage_waves(stages, to_build):
+            for name, (result, seconds) in zip(wave, executor.map(build_stage, wave)):
+                results[name] = result
+                report[name] = {'seconds': seconds, 'cached': False}
+
+        lepto_df = results['clean']
+        start = time.perf_counter()
+        validation = validate_table(lepto_df, source=input_dir)
+        report['validate'] = {'seconds': time.perf_counter() - start, 'cached': False}
+        if report_path:
+            with open(report_path, 'w') as f:
+                json.dump(validation, f, indent=2)
+        if not validation['passed']:
+            raise ValidationError(validation)
+        city_summary = results['city_summary']
+
+        os.makedirs(output_dir, exist_ok=True)
+        start = time.perf_counter()
+        save_table(lepto_df.drop(columns=['adm3_pcode']), os.path.join(output_dir, 'lepto_dfclean.csv'))
+        save_table(city_summary, os.path.join(output_dir, 'city_summary.csv'))
+        report['write'] = {'seconds': time.perf_counter() - start, 'cached': False}
+        if cache:
+            cache.record_outputs(outputs)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild lepto_dfclean.csv and city_summary.csv from the CCHAIN extracts.")
+    parser.add_argument('--input-dir', required=True, help="directory with the raw CCHAIN CSV files")
+    parser.add_argument('--output-dir', default='.', help="where to write the cleaned datasets")
+    parser.add_argument('--start-year', type=int, default=START_YEAR)
+    parser.add_argument('--end-year', type=int, default=END_YEAR)
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS, help="rows per chunk for the barangay-level sources")
+    parser.add_argument('--cache-dir', default=None, help=f"stage cache (default: <output-dir>/{CACHE_DIR})")
+    parser.add_argument('--no-cache', action='store_true', help="rebuild every stage and leave the cache alone")
+    parser.add_argument('--report', default=None, help="write the validation report to this JSON file")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="threads parsing sources and building independent stages")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        report = run_pipeline(args.input_dir, args.output_dir, args.start_year, args.end_year,
+                              chunksize=args.chunksize, cache_dir=args.cache_dir, use_cache=not args.no_cache,
+                              report_path=args.report, workers=args.workers)
+    except ValidationError as e:
+        print("Cleaned data failed validation, nothing written:")
+        for problem in problems(e.report):
+            print(f"  - {problem}")
+        return 1
+    if not report:
+        print("  outputs are up to date")
+    for stage, status in report.items():
+        print(f"  {stage:<16}{status['seconds']:8.3f} s{'  (cached)' if status['cached'] else ''}")
+    print(f"  {'total':<16}{time.perf_counter() - start:8.3f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Lag and rolling-window features for the modeling notebook.
+
+    python lepto_features.py
+    python lepto_features.py --data lepto_dfclean.csv --out features.csv
+
+build_features() adds, for every city, the climate values of earlier weeks,
+rolling precipitation sums, rolling mean humidity and heat index, and the
+case counts of earlier weeks. All of them come from one pass over dense
+city x week arrays (lepto_data.WeeklyPanel), so a week missing from the data
+is a gap rather than a shifted lag. Windows that reach a gap or the start of
+a city's series are NaN.
+
+load_features() keeps the result on disk under the data file's content hash
+and the feature config. Every modeling section and every session then
+reuses one matrix until the data or the windows change.
+"""
+
+import os
+import sys
+import json
+import pickle
+import hashlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from lepto_data import DATA_PATH, WeeklyPanel
+from lepto_snapshot import file_hash, read_lepto_table
+
+# Bump when build_features changes so cached matrices are rebuilt
+FEATURES_VERSION = 1
+
+FEATURE_CACHE_DIR = '.lepto_feature_cache'
+
+DEFAULT_FEATURE_CONFIG = {
+    # Climate values 1..4 weeks earlier
+    'lag_features': ['pr', 'rh', 'tave', 'tmax', 'tmin', 'heat_index'],
+    'climate_lags': [1, 2, 3, 4],
+    # Precipitation summed over the last n weeks (the current week included)
+    'pr_sum_windows': [2, 4, 8],
+    # Humidity and heat index averaged over the last n weeks
+    'mean_features': ['rh', 'heat_index'],
+    'mean_windows': [2, 4, 8],
+    # Case counts 1..4 weeks earlier
+    'case_lags': [1, 2, 3, 4],
+}
+
+
+def _shift(values, weeks):
+    # values[:, t - weeks] at position t
+    shifted = np.full(values.shape, np.nan)
+    shifted[:, weeks:] = values[:, :values.shape[1] - weeks]
+    return shifted
+
+
+def _rolling_sum(values, window):
+    # Sum over weeks t - window + 1 .. t; NaN if any of them is missing
+    padded = np.concatenate([np.full((values.shape[0], window - 1), np.nan), values], axis=1)
+    return np.lib.stride_tricks.sliding_window_view(padded, window, axis=1).sum(axis=-1)
+
+
+def feature_columns(config=DEFAULT_FEATURE_CONFIG):
+    # Names of the columns build_features adds, in order
+    return (
+        [f'{feature}_lag{lag}' for feature in config['lag_features'] for lag in config['climate_lags']]
+        + [f'pr_sum{window}w' for window in config['pr_sum_windows']]
+        + [f'{feature}_mean{window}w' for feature in config['mean_features'] for window in config['mean_windows']]
+        + [f'cases_lag{lag}' for lag in config['case_lags']]
+    )
+
+
+def build_features(lepto_df, config=DEFAULT_FEATURE_CONFIG):
+    # lepto_df with the lag and rolling-window columns appended, rows in their original order
+    sources = ['case_total', 'pr'] + [col for col in config['lag_features'] + config['mean_features'] if col != 'pr']
+    panel = WeeklyPanel(lepto_df, list(dict.fromkeys(sources)))
+
+    features = []
+    for feature in config['lag_features']:
+        features += [_shift(panel[feature], lag) for lag in config['climate_lags']]
+    features += [_rolling_sum(panel['pr'], window) for window in config['pr_sum_windows']]
+    for feature in config['mean_features']:
+        features += [_rolling_sum(panel[feature], window) / window for window in config['mean_windows']]
+    features += [_shift(panel['case_total'], lag) for lag in config['case_lags']]
+
+    added = pd.DataFrame(panel.at_rows(np.stack(features, axis=-1)), index=lepto_df.index,
+                         columns=feature_columns(config))
+    return pd.concat([lepto_df, added], axis=1)
+
+
+def config_key(config):
+    payload = json.dumps({'version': FEATURES_VERSION, 'config': config}, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def load_features(path=DATA_PATH, config=DEFAULT_FEATURE_CONFIG, cache_dir=FEATURE_CACHE_DIR):
+    # build_features(lepto_dfclean) from the on-disk cache when neither the data nor the config changed
+    data_hash = file_hash(path)
+    prefix = f'features-{config_key(config)}-'
+    cache_path = os.path.join(cache_dir, f'{prefix}{data_hash}.pkl')
+    try:
+        return pd.read_pickle(cache_path)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        # Missing, truncated or written by an incompatible pandas: rebuild
+        pass
+
+    features = build_features(read_lepto_table(path, source_hash=data_hash), config)
+    os.makedirs(cache_dir, exist_ok=True)
+    pd.to_pickle(features, cache_path + '.tmp')
+    os.replace(cache_path + '.tmp', cache_path)
+
+    # Matrices of older data versions for this config are no longer needed
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name.endswith('.pkl') and os.path.join(cache_dir, name) != cache_path:
+            os.remove(os.path.join(cache_dir, name))
+    return features
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build (or refresh the cache of) the modeling feature matrix.")
+    parser.add_argument('--data', default=DATA_PATH, help="path to lepto_dfclean.csv")
+    parser.add_argument('--cache-dir', default=FEATURE_CACHE_DIR)
+    parser.add_argument('--out', default=None, help="also write the matrix to this CSV")
+    args = parser.parse_args()
+
+    features = load_features(args.data, cache_dir=args.cache_dir)
+    if args.out:
+        features.to_csv(args.out, index=False)
+    complete = int(features.notna().all(axis=1).sum())
+    print(f"{len(features)} rows x {features.shape[1]} columns "
+          f"({len(feature_columns())} lag/rolling features, {complete} complete rows)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
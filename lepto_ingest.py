@@ -0,0 +1,227 @@
+"""Append-only ingestion of new surveillance weeks.
+
+    python lepto_ingest.py new_week.csv
+    python lepto_ingest.py new_week.csv --data lepto_dfclean.csv --summary city_summary.csv
+    python lepto_ingest.py new_week.csv --report validation.json
+
+A batch holds one row per city and week with `date`, `adm3_en`,
+`case_total` and the climate columns. Rows are checked, joined with the
+city's NOAH flood hazards and its latest population, and run through the
+lepto_validate rules (value ranges, static attributes, the weekly calendar
+continuing from the stored weeks). Errors reject the batch; warnings come
+back in the validation report (`--report` writes it as JSON). Accepted rows
+are scored by the lepto_alerts early-warning detector against the cached
+seasonal baseline, continuing each city's CUSUM from the cached alert
+history, and any alerts are returned and printed. The rows are then
+appended to `lepto_dfclean.csv` without rewriting the existing rows. The
+`city_summary.csv` totals are updated from the new rows alone. A running app
+picks the rows up on its next rerun: the data cache sees that the file only
+grew and parses just the appended rows, and the aggregates of the affected
+cities are recomputed.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import pandas as pd
+
+from lepto_data import DATA_PATH, SUMMARY_PATH, CLIMATE_COLUMNS, HAZARD_COLUMNS, POPULATION_COLUMNS
+from lepto_snapshot import read_lepto_table, save_table
+from lepto_validate import validate_table, problems
+from lepto_aggregates import load_seasonal_baseline
+from lepto_alerts import alert_baseline, load_alert_history, detect, alert_records
+
+# Columns a batch must provide
+INGEST_COLUMNS = ['date', 'adm3_en', 'case_total'] + CLIMATE_COLUMNS
+
+# How many offending rows to name per problem
+MAX_REPORTED_ROWS = 5
+
+
+class IngestError(ValueError):
+    # The batch was rejected; `problems` lists every reason, `report` holds the
+    # validation report when the rejection came from the validation rules
+
+    def __init__(self, problems, report=None):
+        super().__init__('; '.join(problems))
+        self.problems = problems
+        self.report = report
+
+
+def _rows(mask):
+    rows = list(mask[mask].index[:MAX_REPORTED_ROWS])
+    more = int(mask.sum()) - len(rows)
+    return f"rows {rows}" + (f" and {more} more" if more > 0 else '')
+
+
+def load_static(data_path=DATA_PATH):
+    # City, date and static attribute columns of the current dataset, at full CSV precision
+    return read_lepto_table(data_path, columns=['date', 'adm3_en'] + HAZARD_COLUMNS + POPULATION_COLUMNS)
+
+
+def last_weeks(static):
+    # Latest stored week per city
+    return static.groupby(static['adm3_en'].astype(str))['date'].max()
+
+
+def validate_rows(rows, static):
+    # Typed copy of the batch; raises IngestError listing every problem found
+    missing = [col for col in INGEST_COLUMNS if col not in rows.columns]
+    if missing:
+        raise IngestError([f"missing columns: {missing}"])
+
+    rows = rows[INGEST_COLUMNS].reset_index(drop=True)
+    problems = []
+
+    dates = pd.to_datetime(rows['date'], errors='coerce')
+    if dates.isna().any():
+        problems.append(f"unparseable date in {_rows(dates.isna())}")
+
+    unknown = ~rows['adm3_en'].isin(static['adm3_en'].astype(str).unique())
+    if unknown.any():
+        problems.append(f"unknown city {sorted(rows.loc[unknown, 'adm3_en'].astype(str).unique())} in {_rows(unknown)}")
+
+    cases = pd.to_numeric(rows['case_total'], errors='coerce')
+    bad_cases = cases.isna() | (cases < 0) | (cases != cases.round())
+    if bad_cases.any():
+        problems.append(f"case_total must be a non-negative integer in {_rows(bad_cases)}")
+
+    climate = rows[CLIMATE_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    bad_climate = climate.isna().any(axis=1)
+    if bad_climate.any():
+        problems.append(f"missing or non-numeric climate values in {_rows(bad_climate)}")
+
+    duplicated = pd.DataFrame({'adm3_en': rows['adm3_en'], 'date': dates}).duplicated(keep=False)
+    if duplicated.any():
+        problems.append(f"duplicate city/week in {_rows(duplicated)}")
+
+    # Append-only: every row must be newer than the city's latest week
+    not_newer = dates <= rows['adm3_en'].map(last_weeks(static))
+    if not_newer.any():
+        problems.append(f"week already present or older than the latest week in {_rows(not_newer)}")
+
+    if problems:
+        raise IngestError(problems)
+
+    rows = rows.assign(date=dates, case_total=cases.astype('int64'))
+    rows[CLIMATE_COLUMNS] = climate
+    return rows
+
+
+def enrich_rows(rows, static):
+    # Join the city's flood hazards and its population for the row's year (or its latest known year)
+    cities = static['adm3_en'].astype(str)
+    hazards = static[HAZARD_COLUMNS].groupby(cities).first()
+    years = static['date'].dt.year.rename('year')
+    population = static[POPULATION_COLUMNS].groupby([cities, years]).first()
+    latest_population = population.groupby(level='adm3_en').last()
+
+    enriched = rows.join(hazards, on='adm3_en')
+    enriched['year'] = enriched['date'].dt.year
+    enriched = enriched.join(population, on=['adm3_en', 'year'])
+    for col in POPULATION_COLUMNS:
+        enriched[col] = enriched[col].fillna(enriched['adm3_en'].map(latest_population[col]))
+    return enriched.drop(columns=['year'])
+
+
+def _append_csv(rows, csv_path):
+    # Append rows in the file's own column order and line terminator, in a single write
+    with open(csv_path, 'rb') as f:
+        columns = f.readline().decode('utf-8').strip().split(',')
+        f.seek(max(os.path.getsize(csv_path) - 2, 0))
+        ending = f.read()
+    line_terminator = '\r\n' if ending.endswith(b'\r\n') else '\n'
+
+    payload = rows.assign(date=rows['date'].dt.strftime('%Y-%m-%d'))[columns].to_csv(
+        index=False, header=False, lineterminator=line_terminator
+    )
+    if not ending.endswith(b'\n'):
+        payload = line_terminator + payload
+    with open(csv_path, 'a', newline='') as f:
+        f.write(payload)
+
+
+def update_city_summary(city_summary, rows, weeks_before):
+    # New totals from the appended rows alone: cases summed, population averages extended
+    city_summary = city_summary.set_index('adm3_en')
+    added = rows.groupby('adm3_en').agg(
+        weeks=('case_total', 'size'),
+        case_total=('case_total', 'sum'),
+        pop_count_total=('pop_count_total', 'sum'),
+        pop_density=('pop_density', 'sum'),
+    ).reindex(city_summary.index, fill_value=0)
+    weeks = weeks_before.reindex(city_summary.index, fill_value=0)
+
+    city_summary['case_total'] = city_summary['case_total'] + added['case_total']
+    for col in POPULATION_COLUMNS:
+        extended = (city_summary[col] * weeks + added[col]) / (weeks + added['weeks'])
+        city_summary[col] = extended.where(added['weeks'] > 0, city_summary[col])
+    city_summary = city_summary.reset_index()
+    return city_summary.sort_values('case_total', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def ingest(rows, data_path=DATA_PATH, summary_path=SUMMARY_PATH):
+    # Validate, enrich and append a batch of weekly rows; returns what was added
+    # and the validation report. Assumes a single writer at a time.
+    static = load_static(data_path)
+    rows = enrich_rows(validate_rows(rows, static), static)
+    report = validate_table(rows, last_weeks=last_weeks(static), source=data_path)
+    if not report['passed']:
+        raise IngestError(problems(report), report)
+    if rows.empty:
+        return {'rows': 0, 'cities': [], 'validation': report, 'alerts': []}
+
+    # Early warning for the new weeks, continuing the cached history's CUSUM state; only the new rows are scored
+    history = load_alert_history(data_path)
+    alerts, _ = detect(rows, alert_baseline(load_seasonal_baseline(data_path)), history.exposure, history.state)
+
+    weeks_before = static.groupby(static['adm3_en'].astype(str)).size()
+    city_summary = read_lepto_table(summary_path)
+
+    _append_csv(rows, data_path)
+    save_table(update_city_summary(city_summary, rows, weeks_before), summary_path)
+    return {
+        'rows': len(rows),
+        'cities': sorted(rows['adm3_en'].unique()),
+        'weeks': sorted(rows['date'].dt.strftime('%Y-%m-%d').unique()),
+        'validation': report,
+        'alerts': alert_records(alerts),
+    }
+
+
+def write_report(report, report_path):
+    if report is None or report_path is None:
+        return
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append new weekly rows to the LeptoShield dataset.")
+    parser.add_argument('batch', help="CSV with date, adm3_en, case_total and the climate columns")
+    parser.add_argument('--data', default=DATA_PATH, help="path to lepto_dfclean.csv")
+    parser.add_argument('--summary', default=SUMMARY_PATH, help="path to city_summary.csv")
+    parser.add_argument('--report', default=None, help="write the validation report to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        added = ingest(pd.read_csv(args.batch), args.data, args.summary)
+    except IngestError as e:
+        write_report(e.report, args.report)
+        print("Batch rejected:")
+        for problem in e.problems:
+            print(f"  - {problem}")
+        return 1
+    write_report(added['validation'], args.report)
+    print(f"Appended {added['rows']} rows for {len(added['cities'])} cities: weeks {', '.join(added.get('weeks', []))}")
+    for warning in problems(added['validation'], 'warning'):
+        print(f"  warning: {warning}")
+    for alert in added['alerts']:
+        print(f"  [{alert['level']}] {alert['city']} {alert['week']}: {alert['reasons']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
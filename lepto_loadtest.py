@@ -0,0 +1,234 @@
+"""Offline load test for the LeptoShield Streamlit app.
+
+Drives lepto_app.py headlessly through Streamlit's testing API with many
+simultaneous sessions. Each session cycles through every city and every
+risk-factor feature. The test reports rerun latency percentiles,
+throughput and memory per session:
+
+    python lepto_loadtest.py --sessions 16 --rounds 2
+    python lepto_loadtest.py --sessions 16 --prewarm
+    python lepto_loadtest.py --sessions 8 --max-p99-ms 2000 --json
+
+Each simulated interaction re-runs the whole script, because the testing
+API does not scope reruns to fragments. Latencies are therefore an upper
+bound on what a browser session sees. The testing API also keeps some
+per-run state that a real server shares between sessions; see
+share_server_state().
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import argparse
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from lepto_metrics import rss_bytes
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, 'lepto_app.py')
+
+
+def peak_rss_bytes():
+    # High-water mark of this process's resident memory (Linux reports KiB)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def share_server_state():
+    # AppTest sets up per-run state that a real server shares between sessions,
+    # which races when sessions run concurrently. Inside the block:
+    # - it installs a mock Runtime for each run and clears it afterwards, so let
+    #   every session fall back to the most recently installed one;
+    # - it compiles the script into a fresh cache on every run, and CPython's AST
+    #   construction is not thread-safe, so compile one script at a time;
+    # - it patches the global config to switch on test mode for each run, so
+    #   keep test mode on for the whole load test.
+    # The patched Streamlit internals are restored on exit.
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.testing.v1.util import build_mock_config_get_option
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    saved = (Runtime.__dict__['instance'], Runtime.__dict__['exists'], ScriptCache.__dict__['get_bytecode'], config.get_option)
+    original_instance = Runtime.instance.__func__
+    original_exists = Runtime.exists.__func__
+    original_get_bytecode = ScriptCache.get_bytecode
+    last = {}
+    compile_lock = threading.Lock()
+
+    def instance(cls):
+        if cls._instance is not None:
+            last['runtime'] = cls._instance
+            return cls._instance
+        return last['runtime'] if 'runtime' in last else original_instance(cls)
+
+    def exists(cls):
+        return original_exists(cls) or 'runtime' in last
+
+    def get_bytecode(self, script_path):
+        with compile_lock:
+            return original_get_bytecode(self, script_path)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+    ScriptCache.get_bytecode = get_bytecode
+    config.get_option = build_mock_config_get_option({'global.appTest': True})
+    try:
+        yield
+    finally:
+        Runtime.instance, Runtime.exists, ScriptCache.get_bytecode, config.get_option = saved
+
+
+def _run(at, timings, kind):
+    start = time.perf_counter()
+    at.run()
+    timings.append((kind, time.perf_counter() - start))
+    if at.exception:
+        raise RuntimeError(f"{kind} rerun failed: {at.exception[0].value}")
+
+
+def run_session(session_id, rounds, offset, barrier, timings, errors, sessions):
+    from streamlit.testing.v1 import AppTest
+    from lepto_aggregates import OVERLAY_FEATURES
+
+    try:
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        _run(at, timings, 'initial')
+        sessions.append(at)
+        cities = list(at.selectbox[0].options)
+        barrier.wait()
+
+        # Start each session at a different city so they don't move in lockstep
+        for step in range(rounds * len(cities)):
+            city = cities[(step + offset) % len(cities)]
+            at.selectbox[0].select(city)
+            _run(at, timings, 'city')
+            for feature in OVERLAY_FEATURES:
+                at.selectbox[1].select(feature)
+                _run(at, timings, 'feature')
+    except Exception as e:
+        errors.append(f"session {session_id}: {e}")
+        barrier.abort()
+
+
+def warm_up(prewarm_charts=False):
+    # Import the app's dependencies and load the data so the baseline only excludes the sessions
+    import matplotlib.figure  # noqa: F401
+    from streamlit.testing.v1 import AppTest  # noqa: F401
+    from lepto_aggregates import load_city_cube
+    from lepto_data import load_city_summary, load_city_index
+    from lepto_charts import prewarm
+
+    load_city_cube()
+    load_city_summary()
+    load_city_index()
+    if prewarm_charts:
+        prewarm()
+
+
+def load_test(n_sessions=8, rounds=1, prewarm_charts=False):
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+    logging.disable(logging.WARNING)
+
+    warm_up(prewarm_charts)
+    with share_server_state():
+        baseline_rss = rss_bytes()
+        timings = []
+        errors = []
+        sessions = []
+        # Sessions start interacting together once every one of them has loaded the page
+        barrier = threading.Barrier(n_sessions + 1)
+        threads = [
+            threading.Thread(target=run_session, args=(i, rounds, i, barrier, timings, errors, sessions), daemon=True)
+            for i in range(n_sessions)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        loaded_rss = rss_bytes()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        peak_rss = peak_rss_bytes()
+
+    report = {
+        'sessions': n_sessions,
+        'rounds': rounds,
+        'prewarmed_charts': prewarm_charts,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'baseline_rss_mb': round(baseline_rss / 2**20, 1),
+        'peak_rss_mb': round(peak_rss / 2**20, 1),
+        'memory_per_session_mb': round((loaded_rss - baseline_rss) / 2**20 / max(len(sessions), 1), 2),
+        'latency_ms': {},
+    }
+
+    interactive = [seconds for kind, seconds in timings if kind != 'initial']
+    report['reruns'] = len(interactive)
+    report['throughput_reruns_per_s'] = round(len(interactive) / elapsed, 2) if elapsed else None
+
+    for kind in ['initial', 'city', 'feature', 'all']:
+        values = interactive if kind == 'all' else [seconds for k, seconds in timings if k == kind]
+        if not values:
+            continue
+        values = np.array(values) * 1000
+        report['latency_ms'][kind] = {
+            'count': len(values),
+            'p50': round(float(np.percentile(values, 50)), 1),
+            'p90': round(float(np.percentile(values, 90)), 1),
+            'p99': round(float(np.percentile(values, 99)), 1),
+            'max': round(float(values.max()), 1),
+        }
+    return report
+
+
+def print_report(report):
+    print(f"LeptoShield load test: {report['sessions']} sessions x {report['rounds']} round(s)"
+          f"{' (charts prewarmed)' if report['prewarmed_charts'] else ''}")
+    print(f"  reruns        {report['reruns']} in {report['elapsed_s']} s ({report['throughput_reruns_per_s']} reruns/s)")
+    print(f"  memory        {report['baseline_rss_mb']} MB baseline, {report['peak_rss_mb']} MB peak, "
+          f"{report['memory_per_session_mb']} MB per session")
+    print(f"\n  {'rerun':<10}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, stats in report['latency_ms'].items():
+        print(f"  {kind:<10}{stats['count']:>8}{stats['p50']:>10}{stats['p90']:>10}{stats['p99']:>10}{stats['max']:>10}")
+    for error in report['errors']:
+        print(f"\n  ERROR {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the LeptoShield Streamlit app headlessly.")
+    parser.add_argument('--sessions', type=int, default=8, help="number of simultaneous sessions")
+    parser.add_argument('--rounds', type=int, default=1, help="passes over all cities per session")
+    parser.add_argument('--prewarm', action='store_true', help="render every chart before the sessions start")
+    parser.add_argument('--max-p99-ms', type=float, default=None, help="fail if the p99 rerun latency exceeds this")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = load_test(args.sessions, args.rounds, args.prewarm)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failed = bool(report['errors'])
+    p99 = report['latency_ms'].get('all', {}).get('p99')
+    if args.max_p99_ms is not None and p99 is not None and p99 > args.max_p99_ms:
+        print(f"\np99 rerun latency {p99} ms exceeds {args.max_p99_ms} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
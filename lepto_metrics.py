@@ -0,0 +1,182 @@
+"""Prometheus metrics for a running LeptoShield app.
+
+Set `LEPTO_METRICS_PORT` and the app starts a sidecar HTTP thread (once per
+process) that serves the metrics in Prometheus text format:
+
+    LEPTO_METRICS_PORT=9464 streamlit run lepto_app.py
+    curl http://127.0.0.1:9464/metrics
+
+Exposed: page views per city and per city/feature, rerun latency
+histograms per scope, chart and data cache hits/misses, and resident memory.
+The listener binds to `LEPTO_METRICS_HOST` (127.0.0.1 by default).
+"""
+
+import os
+import bisect
+import logging
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the rerun latency histogram buckets
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+logger = logging.getLogger(__name__)
+
+
+def rss_bytes():
+    # Resident memory of this process (Linux)
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    escaped = [str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class Counter:
+    # Monotonic count per label combination
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    # Cumulative bucket counts, sum and count per label combination
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = list(buckets)
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.setdefault(label_values, [0] * (len(self.buckets) + 1) + [0.0])
+            counts[index] += 1
+            counts[-1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((label_values, list(counts)) for label_values, counts in self._values.items())
+        for label_values, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], counts[:-1]):
+                cumulative += count
+                labels = _labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {counts[-1]:.6f}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+city_views = Counter('lepto_city_views_total', 'City Insights renders per city.', ('city',))
+feature_views = Counter('lepto_feature_views_total', 'Risk-factor overlay renders per city and feature.', ('city', 'feature'))
+rerun_seconds = Histogram('lepto_rerun_duration_seconds', 'Script rerun wall time.', ('scope',))
+
+
+def record_view(city, feature=None):
+    if feature is None:
+        city_views.inc(city)
+    else:
+        feature_views.inc(city, feature)
+
+
+def observe_rerun(scope, seconds):
+    rerun_seconds.observe(seconds, scope)
+
+
+def _gauge(name, help_text, value, kind='gauge'):
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+
+
+def render_metrics():
+    # Everything in Prometheus text exposition format
+    from lepto_data import cache_stats
+    from lepto_charts import chart_cache
+
+    lines = []
+    for metric in (city_views, feature_views, rerun_seconds):
+        lines += metric.expose()
+    lines += _gauge('lepto_chart_cache_hits_total', 'Charts served from the rendered chart cache.', chart_cache.hits, 'counter')
+    lines += _gauge('lepto_chart_cache_misses_total', 'Charts that had to be rendered.', chart_cache.misses, 'counter')
+    lines += _gauge('lepto_chart_cache_entries', 'Rendered charts currently cached.', len(chart_cache))
+    lines += _gauge('lepto_data_cache_hits_total', 'Dataset loads served from the process cache.', cache_stats['hits'], 'counter')
+    lines += _gauge('lepto_data_cache_misses_total', 'Dataset loads that parsed the file.', cache_stats['misses'], 'counter')
+    lines += _gauge('lepto_data_cache_appends_total', 'Dataset loads that only parsed appended rows.', cache_stats['appends'], 'counter')
+    lines += _gauge('process_resident_memory_bytes', 'Resident memory size in bytes.', rss_bytes())
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        payload = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host=None):
+    # Serve /metrics from a daemon thread, once per process; returns the server (None if disabled)
+    global _server, _server_started
+    port = port if port is not None else os.environ.get('LEPTO_METRICS_PORT')
+    if port in (None, ''):
+        return None
+    with _server_lock:
+        if _server_started:
+            return _server
+        _server_started = True
+        host = host or os.environ.get('LEPTO_METRICS_HOST', '127.0.0.1')
+        try:
+            _server = MetricsServer((host, int(port)), MetricsHandler)
+        except OSError as e:
+            # Another replica on this host already owns the port; keep the app running
+            logger.warning("LeptoShield metrics not started on %s:%s: %s", host, port, e)
+            return None
+        threading.Thread(target=_server.serve_forever, name='lepto-metrics', daemon=True).start()
+        return _server
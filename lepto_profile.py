@@ -0,0 +1,161 @@
+"""Cold-start profile of the LeptoShield app.
+
+Runs the app's imports and its first render in a fresh interpreter, reports
+where the time goes and fails if the total exceeds a budget:
+
+    python lepto_profile.py --budget 5
+    python lepto_profile.py --json
+
+Import times come from `python -X importtime`; the first render is timed
+stage by stage (data load, aggregates, alert history, chart renders) and as a full
+headless run of lepto_app.py through Streamlit's testing API.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules the app imports at startup
+APP_IMPORTS = ['streamlit', 'pandas', 'lepto_data', 'lepto_aggregates', 'lepto_charts', 'lepto_timing', 'lepto_metrics',
+               'lepto_alerts']
+
+# Heavy modules that must not be imported on the app's startup path
+FORBIDDEN_IMPORTS = ['sklearn', 'shap', 'plotly', 'googletrans']
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def _child():
+    # Runs inside the profiled interpreter; prints stage timings as JSON
+    timings = {}
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+
+    start = time.perf_counter()
+    for module in APP_IMPORTS:
+        __import__(module)
+    timings['imports'] = time.perf_counter() - start
+
+    from lepto_data import load_lepto_df, load_city_summary, load_city_index
+    from lepto_aggregates import load_city_cube, OVERLAY_FEATURES
+    from lepto_charts import get_chart, CITY_CHARTS
+    from lepto_alerts import load_alert_history
+
+    stage = time.perf_counter()
+    load_lepto_df()
+    load_city_summary()
+    timings['data_load'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    load_city_cube()
+    city_index = load_city_index()
+    timings['aggregates'] = time.perf_counter() - stage
+
+    # Scores of every stored week, for the early-warning banner
+    stage = time.perf_counter()
+    alert_history = load_alert_history()
+    timings['alert_history'] = time.perf_counter() - stage
+
+    # The charts a first page view shows: the default city and feature
+    stage = time.perf_counter()
+    city = city_index.cities[0]
+    alert_history.city_alert(city)
+    for chart in CITY_CHARTS:
+        get_chart(city, chart)
+    get_chart(city, 'overlay', OVERLAY_FEATURES[0])
+    timings['first_charts'] = time.perf_counter() - stage
+
+    timings['first_render'] = time.perf_counter() - start
+    timings['loaded_forbidden'] = [m for m in FORBIDDEN_IMPORTS if m in sys.modules]
+
+    # Full headless run of the app script (everything above is already warm)
+    from streamlit.testing.v1 import AppTest
+    stage = time.perf_counter()
+    at = AppTest.from_file(os.path.join(APP_DIR, 'lepto_app.py'), default_timeout=120).run()
+    timings['app_script_run'] = time.perf_counter() - stage
+    timings['app_errors'] = [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+    print(json.dumps(timings))
+
+
+def _parse_importtime(stderr):
+    # Cumulative import time (seconds) of each top-level import
+    top_level = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            module = match.group(4)
+            top_level[module] = top_level.get(module, 0) + int(match.group(2)) / 1e6
+    return top_level
+
+
+def profile():
+    env = dict(os.environ, MPLBACKEND='Agg')
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--child'],
+        capture_output=True, text=True, cwd=APP_DIR, env=env
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Profiled interpreter failed:\n{result.stderr[-2000:]}")
+
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['wall'] = wall
+    timings['top_imports'] = sorted(_parse_importtime(result.stderr).items(), key=lambda item: item[1], reverse=True)
+    timings['forbidden_imports'] = timings.pop('loaded_forbidden')
+    return timings
+
+
+def print_report(report, top):
+    print("LeptoShield cold-start profile")
+    print(f"  imports          {report['imports']:8.3f} s")
+    print(f"  data load        {report['data_load']:8.3f} s")
+    print(f"  aggregates       {report['aggregates']:8.3f} s")
+    print(f"  alert history    {report['alert_history']:8.3f} s")
+    print(f"  first charts     {report['first_charts']:8.3f} s")
+    print(f"  first render     {report['first_render']:8.3f} s  (imports through first charts)")
+    print(f"  app script run   {report['app_script_run']:8.3f} s  (warm, headless)")
+    print(f"  interpreter wall {report['wall']:8.3f} s")
+    print("\nSlowest top-level imports:")
+    for module, seconds in report['top_imports'][:top]:
+        print(f"  {module:<40} {seconds:8.3f} s")
+    if report['forbidden_imports']:
+        print(f"\nHeavy modules imported on the startup path: {', '.join(report['forbidden_imports'])}")
+    if report['app_errors']:
+        print(f"\nApp errors: {report['app_errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the LeptoShield app's cold start.")
+    parser.add_argument('--budget', type=float, default=float(os.environ.get('LEPTO_COLD_START_BUDGET', 0)) or None,
+                        help="fail if imports + first render take longer than this many seconds")
+    parser.add_argument('--top', type=int, default=10, help="number of top-level imports to list")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child()
+        return 0
+
+    report = profile()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.top)
+
+    failed = bool(report['forbidden_imports'] or report['app_errors'])
+    if args.budget is not None and report['first_render'] > args.budget:
+        print(f"\nCold start {report['first_render']:.3f} s exceeds the {args.budget:.3f} s budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""Batch rendering of the EDA figure set.
+
+    python lepto_report.py --out report
+    python lepto_report.py --out report --workers 4
+    python lepto_report.py --out report --only city_feature --force
+
+Renders the figures of lepto_cchain_eda.py headlessly (Agg, no pyplot) on a
+process pool and writes them as PNGs to the output directory, together with
+a manifest.json. The figures are the case totals, yearly and monthly cases,
+histograms, cases over time and cases vs. each climate feature per city. Each manifest
+entry records a hash of the data the figure plots. A rerun only renders
+figures whose inputs changed or whose file is missing, and removes figures
+that are no longer part of the set.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from lepto_data import DATA_PATH, CityIndex, HAZARD_COLUMNS
+from lepto_aggregates import build_case_summaries, min_max_scale
+from lepto_snapshot import read_lepto_table
+
+# Bump when a renderer changes so every figure is redrawn
+REPORT_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+
+# Climate features plotted against the cases for every city
+REPORT_FEATURES = ['pr', 'tave', 'tmax', 'tmin', 'rh', 'heat_index']
+
+HIGHLIGHT_COLOR = '#19535B'
+REST_COLOR = 'gray'
+FEATURE_COLOR = '#1477EA'
+FIGURE_DPI = 100
+
+
+def _faint_grid(ax):
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5, color='gray', alpha=0.3)
+
+
+def _year_axis(ax):
+    import matplotlib.dates as mdates
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
+    ax.xaxis.set_major_locator(mdates.YearLocator(1))
+
+
+def _total_cases(fig, total):
+    # Cases per city, highest first, top 3 highlighted
+    total = total.sort_values(ascending=False)
+    ax = fig.subplots()
+    colors = [HIGHLIGHT_COLOR if i < 3 else REST_COLOR for i in range(len(total))]
+    bars = ax.barh(total.index, total.to_numpy(), color=colors)
+    ax.invert_yaxis()
+    for bar in bars:
+        width = bar.get_width()
+        ax.text(width + (width * 0.01), bar.get_y() + bar.get_height() / 2, f'{int(width)}',
+                va='center', ha='left', fontsize=12, color='black')
+    ax.tick_params(labelsize=16)
+    ax.margins(x=0.07, y=0.05)
+
+
+def _yearly_totals(fig, yearly_total):
+    # Cases of all cities per year, top 3 years highlighted
+    ax = fig.subplots()
+    top_years = yearly_total.sort_values(ascending=False).index[:3]
+    colors = [HIGHLIGHT_COLOR if year in top_years else REST_COLOR for year in yearly_total.index]
+    ax.bar(yearly_total.index, yearly_total.to_numpy(), color=colors)
+    ax.set_xticks(yearly_total.index)
+    ax.tick_params(labelsize=14)
+
+
+def _yearly_by_city(fig, yearly):
+    ax = fig.subplots()
+    for city in yearly.columns:
+        ax.plot(yearly.index, yearly[city], marker='o', label=city)
+    ax.set_title('Time Series of Leptospirosis Cases by City')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Number of Cases')
+    ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
+    ax.grid(True)
+
+
+def _city_yearly(fig, cases, city):
+    ax = fig.subplots()
+    ax.plot(cases.index, cases.to_numpy(), marker='o', label=city)
+    ax.set_title(f'Yearly Leptospirosis Cases in {city}')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Number of Cases')
+    ax.grid(True)
+
+
+def _city_monthly(fig, cases, city):
+    ax = fig.subplots()
+    ax.plot(cases.index, cases.to_numpy(), label=city, color=HIGHLIGHT_COLOR)
+    ax.set_title(f'Monthly Leptospirosis Cases in {city}')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Number of Cases')
+    ax.tick_params(labelsize=12)
+    _faint_grid(ax)
+
+
+def _histograms(fig, frame, title_format='Histogram of {column}', columns_per_row=3):
+    # One histogram per column of `frame` (or per city, see _feature_by_city)
+    n_rows = int(np.ceil(frame.shape[1] / columns_per_row))
+    axes = np.atleast_1d(fig.subplots(n_rows, columns_per_row)).flatten()
+    for ax, column in zip(axes, frame.columns):
+        ax.hist(frame[column].dropna(), bins=30, color=HIGHLIGHT_COLOR)
+        ax.set_title(title_format.format(column=column))
+        ax.set_ylabel('Frequency')
+        ax.grid(True, linestyle='--', linewidth=0.5)
+    for ax in axes[frame.shape[1]:]:
+        ax.axis('off')
+
+
+def _feature_by_city(fig, by_city, feature):
+    # Histograms of one feature, one panel per city
+    _histograms(fig, by_city, title_format=f'{feature} in {{column}}')
+
+
+def _city_cases(fig, cases, city):
+    ax = fig.subplots()
+    ax.plot(cases.index, cases.to_numpy(), label=city, color=HIGHLIGHT_COLOR)
+    ax.set_title(f'Leptospirosis Cases Over Time in {city}', fontsize=14)
+    ax.set_ylabel('Number of Cases', fontsize=12)
+    ax.set_xlabel('Date', fontsize=12)
+    _year_axis(ax)
+    ax.tick_params(labelsize=12)
+    _faint_grid(ax)
+    fig.autofmt_xdate()
+
+
+def _city_feature(fig, city_data, city, feature):
+    # Min-max scaled cases and feature over time
+    ax = fig.subplots()
+    ax.plot(city_data.index, min_max_scale(city_data['case_total']), label='Leptospirosis Cases',
+            color=HIGHLIGHT_COLOR, linewidth=2.5)
+    ax.plot(city_data.index, min_max_scale(city_data[feature]), label=feature, color=FEATURE_COLOR, linewidth=1.0)
+    ax.set_title(f'{city}: Leptospirosis Cases vs. {feature}', fontsize=18)
+    _year_axis(ax)
+    ax.set_xlim(city_data.index.min() - pd.DateOffset(months=6), city_data.index.max() + pd.DateOffset(months=6))
+    ax.tick_params(labelsize=18)
+    _faint_grid(ax)
+    ax.legend(loc='upper left', fontsize=18)
+
+
+# kind -> (renderer, figure size in inches)
+RENDERERS = {
+    'total_cases': (_total_cases, (12, 8)),
+    'yearly_totals': (_yearly_totals, (10, 6)),
+    'yearly_by_city': (_yearly_by_city, (14, 8)),
+    'city_yearly': (_city_yearly, (10, 6)),
+    'city_monthly': (_city_monthly, (10, 6)),
+    'histograms': (_histograms, (15, 12)),
+    'feature_by_city': (_feature_by_city, (15, 16)),
+    'city_cases': (_city_cases, (10, 6)),
+    'city_feature': (_city_feature, (16, 12)),
+}
+
+
+def _slug(text):
+    return ''.join(char if char.isalnum() else '_' for char in str(text).lower()).strip('_')
+
+
+def figure_jobs(lepto_df, kinds=None):
+    # Every figure of the report as (name, kind, data, params); the data is only what the figure plots.
+    # Dates are brought to one unit so the snapshot and a CSV parse hash alike.
+    lepto_df = lepto_df.assign(date=lepto_df['date'].astype('datetime64[ns]'))
+    summaries = build_case_summaries(lepto_df)
+    yearly, monthly = summaries['yearly'], summaries['monthly'].to_timestamp()
+    city_index = CityIndex(lepto_df)
+    numeric = [col for col in lepto_df.columns if col not in ['date', 'adm3_en'] + HAZARD_COLUMNS
+               and pd.api.types.is_numeric_dtype(lepto_df[col])]
+
+    jobs = [
+        ('total_cases', 'total_cases', summaries['total'], {}),
+        ('yearly_totals', 'yearly_totals', yearly.sum(axis=1), {}),
+        ('yearly_by_city', 'yearly_by_city', yearly, {}),
+        ('histograms', 'histograms', lepto_df[numeric], {}),
+    ]
+    for city in yearly.columns:
+        jobs.append((f'yearly_{_slug(city)}', 'city_yearly', yearly[city], {'city': city}))
+        jobs.append((f'monthly_{_slug(city)}', 'city_monthly', monthly[city], {'city': city}))
+
+    for feature in numeric:
+        by_city = pd.DataFrame({city: rows[feature].reset_index(drop=True) for city, rows in city_index})
+        jobs.append((f'histogram_{_slug(feature)}_by_city', 'feature_by_city', by_city, {'feature': feature}))
+
+    for city, rows in city_index:
+        city_data = rows.set_index('date')
+        jobs.append((f'cases_{_slug(city)}', 'city_cases', city_data['case_total'], {'city': city}))
+        for feature in REPORT_FEATURES:
+            jobs.append((f'cases_vs_{_slug(feature)}_{_slug(city)}', 'city_feature',
+                         city_data[['case_total', feature]], {'city': city, 'feature': feature}))
+
+    return [job for job in jobs if kinds is None or job[1] in kinds]
+
+
+def input_digest(kind, data, params):
+    # Hash of everything a figure depends on: renderer version, kind, parameters and plotted values
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([REPORT_VERSION, kind, params], sort_keys=True, default=str).encode('utf-8'))
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    digest.update(json.dumps([str(col) for col in frame.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def render_figure(out_dir, name, kind, data, params):
+    # Render one figure to <out_dir>/<name>.png (runs in a worker process)
+    from matplotlib.figure import Figure
+
+    start = time.perf_counter()
+    renderer, size = RENDERERS[kind]
+    fig = Figure(figsize=size, layout='constrained')
+    renderer(fig, data, **params)
+    path = os.path.join(out_dir, f'{name}.png')
+    tmp_path = path + '.tmp'
+    fig.savefig(tmp_path, format='png', dpi=FIGURE_DPI)
+    os.replace(tmp_path, path)
+    return name, time.perf_counter() - start, os.path.getsize(path)
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def build_report(out_dir, data_path=DATA_PATH, workers=None, kinds=None, force=False):
+    # Render the figures whose inputs changed; returns {'rendered', 'skipped', 'removed', 'seconds'}
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    lepto_df = read_lepto_table(data_path)
+    jobs = figure_jobs(lepto_df, kinds)
+
+    previous = read_manifest(out_dir).get('figures', {})
+    figures = {}
+    pending = []
+    for name, kind, data, params in jobs:
+        entry = {'file': f'{name}.png', 'kind': kind, 'params': params, 'inputs': input_digest(kind, data, params)}
+        old = previous.get(name)
+        if (not force and old is not None and old['inputs'] == entry['inputs']
+                and os.path.exists(os.path.join(out_dir, entry['file']))):
+            figures[name] = old
+        else:
+            figures[name] = entry
+            pending.append((name, kind, data, params))
+
+    # Figures outside this run's selection stay; figures no longer in the set are removed
+    removed = []
+    for name, entry in previous.items():
+        if name in figures:
+            continue
+        if kinds is not None and entry['kind'] not in kinds:
+            figures[name] = entry
+            continue
+        removed.append(name)
+        try:
+            os.remove(os.path.join(out_dir, entry['file']))
+        except OSError:
+            pass
+
+    workers = workers or os.cpu_count() or 1
+    args = [[out_dir] * len(pending)] + [list(column) for column in zip(*pending)] if pending else []
+    if pending and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            results = list(pool.map(render_figure, *args, chunksize=max(1, len(pending) // (workers * 4))))
+    else:
+        _init_worker()
+        results = [render_figure(*job_args) for job_args in zip(*args)] if pending else []
+
+    for name, seconds, size in results:
+        figures[name].update(seconds=round(seconds, 3), bytes=size)
+    write_manifest(out_dir, {'version': REPORT_VERSION, 'source': os.path.abspath(data_path), 'figures': figures})
+    return {
+        'rendered': len(results),
+        'skipped': len(jobs) - len(results),
+        'removed': len(removed),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the LeptoShield EDA figures to a directory.")
+    parser.add_argument('--out', default='report', help="output directory for the PNGs and manifest.json")
+    parser.add_argument('--data', default=DATA_PATH, help="path to lepto_dfclean.csv")
+    parser.add_argument('--workers', type=int, default=None, help="render processes (default: one per core)")
+    parser.add_argument('--only', nargs='+', choices=sorted(RENDERERS), default=None, help="render only these kinds")
+    parser.add_argument('--force', action='store_true', help="re-render even unchanged figures")
+    args = parser.parse_args()
+
+    summary = build_report(args.out, args.data, args.workers, args.only, args.force)
+    print(f"{summary['rendered']} rendered, {summary['skipped']} unchanged, {summary['removed']} removed "
+          f"in {summary['seconds']} s -> {os.path.join(args.out, MANIFEST_NAME)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
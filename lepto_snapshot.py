@@ -0,0 +1,212 @@
+"""Binary columnar snapshots of the cleaned CSV datasets.
+
+A snapshot of `lepto_dfclean.csv` lives next to it in `lepto_dfclean.snapshot/`:
+one typed `.npy` array per column with the rows grouped by city, plus a
+`manifest.json` recording the columns, each city's row range and the
+content hash of the CSV it was built from. Column files carry the name of
+the generation that wrote them, and a new manifest only replaces the old one
+once all of its columns are on disk, so a reader always sees one consistent
+generation. Readers memory-map only the
+columns they ask for and slice only the cities they ask for, and fall back
+to the CSV whenever the snapshot is missing or stale.
+"""
+
+import os
+import re
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_VERSION = 2
+MANIFEST = 'manifest.json'
+
+# Original row position, used to restore the CSV row order on full reads
+ROW_COLUMN = '_row'
+
+
+def file_hash(path, chunk_size=1 << 20, limit=None):
+    # Content hash of a file (or of its first `limit` bytes), read in chunks so large files stay cheap on memory
+    digest = hashlib.blake2b(digest_size=16)
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_dir(csv_path):
+    return os.path.splitext(csv_path)[0] + '.snapshot'
+
+
+def _column_file(col, generation):
+    return f"{re.sub(r'[^A-Za-z0-9_]+', '_', col)}.{generation}.npy"
+
+
+def _column_array(series):
+    # Typed array for one column; dates become datetime64[D], text becomes fixed-width unicode
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy().astype('datetime64[D]'), 'datetime'
+    if isinstance(series.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(series):
+        return series.astype(str).to_numpy().astype(str), 'text'
+    return series.to_numpy(), 'numeric'
+
+
+def _save_array(out_dir, file_name, values):
+    # Write to a temporary name first so readers never see a half-written column
+    tmp_path = os.path.join(out_dir, file_name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.save(f, values, allow_pickle=False)
+    os.replace(tmp_path, os.path.join(out_dir, file_name))
+
+
+def write_snapshot(lepto_df, out_dir, partition_col='adm3_en', source_hash=None):
+    # Write `lepto_df` column by column, rows grouped by `partition_col` (one partition if None).
+    # Columns go to files of a new generation; the manifest switches readers over in one rename.
+    os.makedirs(out_dir, exist_ok=True)
+    previous = read_manifest(out_dir)
+    generation = os.urandom(8).hex()
+
+    frame = lepto_df.reset_index(drop=True)
+    rows = np.arange(len(frame), dtype='int32')
+    partitions = []
+    if partition_col is not None:
+        values = frame[partition_col].astype(str).to_numpy()
+        order = np.argsort(values, kind='stable')
+        frame = frame.iloc[order].reset_index(drop=True)
+        rows = rows[order]
+        values = values[order]
+        starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(values)]
+        partitions = [{'value': values[start], 'start': int(start), 'stop': int(stop)} for start, stop in zip(starts, stops)]
+    else:
+        partitions = [{'value': None, 'start': 0, 'stop': len(frame)}]
+
+    kinds = {}
+    for col in frame.columns:
+        if col == partition_col:
+            continue
+        array, kinds[col] = _column_array(frame[col])
+        _save_array(out_dir, _column_file(col, generation), array)
+    _save_array(out_dir, _column_file(ROW_COLUMN, generation), rows)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'source_hash': source_hash,
+        'partition_col': partition_col,
+        'columns': list(lepto_df.columns),
+        'kinds': kinds,
+        'generation': generation,
+        'files': {col: _column_file(col, generation) for col in list(kinds) + [ROW_COLUMN]},
+        'partitions': partitions,
+        'rows': len(frame),
+    }
+    tmp_path = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST))
+
+    # Keep the previous generation for readers that still hold its manifest; drop anything older
+    keep = set(manifest['files'].values()) | set((previous or {}).get('files', {}).values())
+    for name in os.listdir(out_dir):
+        if name.endswith('.npy') and name not in keep:
+            try:
+                os.remove(os.path.join(out_dir, name))
+            except OSError:
+                pass
+    return manifest
+
+
+def read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == SNAPSHOT_VERSION else None
+
+
+def read_snapshot(out_dir, columns=None, cities=None, manifest=None):
+    # Read a snapshot back into a DataFrame, loading only the requested columns and cities.
+    # The partition column comes back as a categorical; full reads keep the original row order.
+    manifest = manifest or read_manifest(out_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No snapshot found in {out_dir}")
+
+    partition_col = manifest['partition_col']
+    columns = list(manifest['columns']) if columns is None else list(columns)
+    partitions = [p for p in manifest['partitions'] if cities is None or p['value'] in cities]
+    full_read = len(partitions) == len(manifest['partitions'])
+
+    def load(file_name):
+        return np.load(os.path.join(out_dir, file_name), mmap_mode='r', allow_pickle=False)
+
+    # Rows to take from each memory-mapped column: everything (in CSV order) or the selected cities
+    if full_read:
+        inverse = np.empty(manifest['rows'], dtype='int64')
+        inverse[load(manifest['files'][ROW_COLUMN])] = np.arange(manifest['rows'])
+        take = inverse
+    else:
+        take = np.concatenate([np.arange(p['start'], p['stop']) for p in partitions]) if partitions else np.array([], dtype='int64')
+
+    frame = {}
+    for col in columns:
+        if col == partition_col:
+            codes = np.repeat(np.arange(len(partitions), dtype='int32'), [p['stop'] - p['start'] for p in partitions])
+            if full_read:
+                codes = codes[inverse]
+            frame[col] = pd.Categorical.from_codes(codes, [p['value'] for p in partitions])
+            continue
+        values = np.asarray(load(manifest['files'][col])[take])
+        if manifest['kinds'][col] == 'datetime':
+            values = values.astype('datetime64[ns]')
+        frame[col] = values
+    return pd.DataFrame(frame, columns=columns)
+
+
+def is_fresh(csv_path, source_hash=None, manifest=None):
+    # A snapshot is fresh if it was built from the CSV's current content (or the CSV is absent)
+    manifest = manifest or read_manifest(snapshot_dir(csv_path))
+    if manifest is None:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return manifest.get('source_hash') == (source_hash or file_hash(csv_path))
+
+
+def read_lepto_table(csv_path, columns=None, cities=None, source_hash=None, write_through=False):
+    # Wide table from the binary snapshot when it is fresh, otherwise from the CSV.
+    # With write_through=True a full CSV parse also (re)builds the snapshot for the next reader.
+    out_dir = snapshot_dir(csv_path)
+    manifest = read_manifest(out_dir)
+    if is_fresh(csv_path, source_hash, manifest):
+        return read_snapshot(out_dir, columns, cities, manifest)
+
+    frame = pd.read_csv(csv_path, usecols=columns)
+    if 'date' in frame.columns:
+        frame['date'] = pd.to_datetime(frame['date'])
+
+    if write_through and columns is None:
+        try:
+            write_snapshot(frame, out_dir, source_hash=source_hash or file_hash(csv_path))
+        except OSError:
+            # Read-only deployments simply keep using the CSV
+            pass
+
+    if cities is not None:
+        frame = frame[frame['adm3_en'].isin(cities)].reset_index(drop=True)
+    return frame
+
+
+def save_table(lepto_df, csv_path, partition_col='adm3_en'):
+    # Write the CSV and its binary snapshot side by side; readers never see a half-written CSV
+    tmp_path = csv_path + '.tmp'
+    lepto_df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_path)
+    return write_snapshot(lepto_df, snapshot_dir(csv_path), partition_col, source_hash=file_hash(csv_path))
@@ -0,0 +1,202 @@
+"""Per-rerun render timings for the LeptoShield app.
+
+Off by default. Turn it on for every session with `LEPTO_TIMING=1`, or for
+one browser session by opening the app with `?timing=1`. Each timed rerun
+shows a collapsible breakdown at the bottom of the page and appends one
+JSON record to `lepto_timing.jsonl` (or `LEPTO_TIMING_LOG`). Summarize the
+log with:
+
+    python lepto_timing.py
+    python lepto_timing.py --log other_timing.jsonl
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from lepto_metrics import observe_rerun
+
+LOG_PATH = os.environ.get('LEPTO_TIMING_LOG', 'lepto_timing.jsonl')
+
+# Each script run happens on its own thread, so the active timer is per thread
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+class RerunTimer:
+    # Wall-clock time of each named stage of one rerun
+
+    def __init__(self, scope, session_id=None):
+        self.scope = scope
+        self.session_id = session_id
+        self.timestamp = time.time()
+        self.stages = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append(dict(stage=name, ms=round((time.perf_counter() - start) * 1000, 3), **fields))
+
+    def record(self):
+        return {
+            'timestamp': round(self.timestamp, 3),
+            'session': self.session_id,
+            'scope': self.scope,
+            'total_ms': round((time.perf_counter() - self._start) * 1000, 3),
+            'stages': self.stages,
+        }
+
+
+def _script_run_ctx():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    return get_script_run_ctx(suppress_warning=True)
+
+
+def timing_requested():
+    # LEPTO_TIMING=1 for the whole process, ?timing=1 for a single session
+    if os.environ.get('LEPTO_TIMING') == '1':
+        return True
+    import streamlit as st
+    query_params = getattr(st, 'query_params', None)
+    try:
+        return query_params is not None and query_params.get('timing') == '1'
+    except Exception:
+        # No script run context (e.g. bare `python lepto_app.py`)
+        return False
+
+
+def start_run(scope='page'):
+    # Begin timing a full script run; returns None when the stage breakdown is off.
+    # The total rerun time always feeds the metrics.
+    _local.run = (scope, time.perf_counter())
+    timer = None
+    if timing_requested():
+        ctx = _script_run_ctx()
+        timer = RerunTimer(scope, ctx.session_id if ctx else None)
+    _local.timer = timer
+    return timer
+
+
+def active_timer():
+    return getattr(_local, 'timer', None)
+
+
+@contextmanager
+def stage(name, **fields):
+    # Time a block against the active rerun; a no-op when timing is off
+    timer = active_timer()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name, **fields):
+        yield
+
+
+@contextmanager
+def fragment_run(scope):
+    # Inside a full run (or an enclosing fragment) the stages join the running
+    # timer; a rerun of the fragment alone is timed, shown and logged on its own
+    ctx = _script_run_ctx()
+    if not (ctx and ctx.fragment_ids_this_run) or getattr(_local, 'fragment_depth', 0):
+        yield
+        return
+
+    timer = start_run(scope)
+    _local.fragment_depth = 1
+    try:
+        yield
+    except BaseException:
+        # Interrupted (e.g. by a newer rerun): nothing to record
+        _local.run = _local.timer = None
+        raise
+    finally:
+        _local.fragment_depth = 0
+    finish_run(timer)
+
+
+def finish_run(timer, log_path=None):
+    # Record the rerun time; with the breakdown on, also show it in the page and log it
+    run = getattr(_local, 'run', None)
+    _local.run = _local.timer = None
+    if run is not None:
+        observe_rerun(run[0], time.perf_counter() - run[1])
+    if timer is None:
+        return None
+    record = timer.record()
+    show_breakdown(record)
+    append_log(record, log_path or LOG_PATH)
+    return record
+
+
+def show_breakdown(record):
+    import streamlit as st
+    with st.expander(f"Render timings: {record['total_ms']:.1f} ms ({record['scope']})"):
+        stages = pd.DataFrame(record['stages'])
+        if not stages.empty:
+            st.dataframe(stages, hide_index=True)
+
+
+def append_log(record, log_path=LOG_PATH):
+    line = json.dumps(record) + '\n'
+    try:
+        with _log_lock, open(log_path, 'a') as f:
+            f.write(line)
+    except OSError:
+        # A read-only deployment still shows the in-page breakdown
+        pass
+
+
+def read_log(log_path=LOG_PATH):
+    # One row per timed stage, with the rerun's session, scope and timestamp
+    rows = []
+    with open(log_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for stage_record in record['stages']:
+                rows.append(dict(stage_record, session=record['session'], scope=record['scope'], timestamp=record['timestamp']))
+    return pd.DataFrame(rows)
+
+
+def summarize(log_path=LOG_PATH):
+    # Count, mean, p50, p90 and total time per stage, slowest total first
+    stages = read_log(log_path)
+    if stages.empty:
+        return stages
+    grouped = stages.groupby('stage')['ms']
+    summary = pd.DataFrame({
+        'count': grouped.count(),
+        'mean_ms': grouped.mean(),
+        'p50_ms': grouped.median(),
+        'p90_ms': grouped.quantile(0.9),
+        'total_ms': grouped.sum(),
+    })
+    if 'cached' in stages.columns:
+        # Share of chart lookups that had to render
+        charts = stages.dropna(subset=['cached'])
+        summary['miss_rate'] = 1 - charts.groupby('stage')['cached'].mean().astype(float)
+    return summary.sort_values('total_ms', ascending=False).round(3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize LeptoShield render timings.")
+    parser.add_argument('--log', default=LOG_PATH, help="timing log written by the app")
+    args = parser.parse_args()
+    print(summarize(args.log).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""Data validation for the LeptoShield weekly dataset.
+
+    python lepto_validate.py
+    python lepto_validate.py lepto_dfclean.csv --json > validation.json
+
+Runs the quality checks of lepto_cchain_eda.py as vectorized rules over the
+whole table in one pass: duplicate rows and city/week keys, missing values
+(e.g. years without population data), cities with more than one value of a
+static attribute, out-of-range measurements, weeks a city is missing and
+gaps in the weekly calendar. The result is a JSON-ready report. The ETL and
+the ingestion reject data with errors; warnings are only reported.
+"""
+
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from lepto_data import DATA_PATH, HAZARD_COLUMNS, POPULATION_COLUMNS
+from lepto_snapshot import read_lepto_table
+
+# A row is one city and week
+KEY_COLUMNS = ['adm3_en', 'date']
+
+# Plausible (min, max) per column, None for unbounded
+VALUE_RANGES = {
+    'case_total': (0, None),
+    'heat_index': (0, 60),
+    'pr': (0, 1000),
+    'rh': (0, 100),
+    'tave': (0, 45),
+    'tmax': (0, 50),
+    'tmin': (0, 45),
+    **{col: (0, 100) for col in HAZARD_COLUMNS},
+    'pop_count_total': (0, None),
+    'pop_density': (0, None),
+}
+
+# Attributes that must have a single value per group ('year' is taken from the date)
+STATIC_ATTRIBUTES = [
+    (['adm3_en'], HAZARD_COLUMNS),
+    (['adm3_en', 'year'], POPULATION_COLUMNS),
+]
+
+# Severity of each check: errors reject the data, warnings are only reported
+SEVERITY = {
+    'duplicate_rows': 'error',
+    'duplicate_keys': 'error',
+    'missing_values': 'error',
+    'non_unique_static': 'error',
+    'out_of_range': 'error',
+    'misaligned_weeks': 'error',
+    'missing_weeks': 'warning',
+    'calendar_gaps': 'warning',
+}
+
+WEEK = np.timedelta64(7, 'D')
+
+# How many offending rows/groups to list per check
+MAX_EXAMPLES = 5
+
+
+def _examples(frame):
+    # First few offending rows as plain JSON values
+    frame = frame.head(MAX_EXAMPLES)
+    if frame.empty:
+        return []
+    for col in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[col]):
+            frame = frame.assign(**{col: frame[col].dt.strftime('%Y-%m-%d')})
+    return json.loads(frame.to_json(orient='records'))
+
+
+def _result(check, count, message, examples=None):
+    return {
+        'check': check,
+        'severity': SEVERITY[check],
+        'passed': not count,
+        'count': int(count),
+        'message': message if count else '',
+        'examples': examples if count else [],
+    }
+
+
+def check_duplicates(lepto_df):
+    # Exact duplicate rows, and rows sharing a city/week with different values.
+    # Rows are compared by a 64-bit hash of their values, computed once.
+    row_hash = pd.Series(pd.util.hash_pandas_object(lepto_df, index=False).to_numpy())
+    key_hash = pd.Series(pd.util.hash_pandas_object(lepto_df[KEY_COLUMNS], index=False).to_numpy())
+    exact = row_hash.duplicated().to_numpy()
+    same_key = (key_hash.duplicated(keep=False) & ~row_hash.duplicated(keep=False)).to_numpy()
+    keys = lepto_df[KEY_COLUMNS].rename_axis('row').reset_index()
+    return [
+        _result('duplicate_rows', exact.sum(), f"{int(exact.sum())} duplicate rows", _examples(keys[exact])),
+        _result('duplicate_keys', same_key.sum(), f"{int(same_key.sum())} rows share a city/week with different values",
+                _examples(keys[same_key])),
+    ]
+
+
+def check_missing(lepto_df, years):
+    # Missing values per column, with the cities and years they fall in
+    missing = lepto_df.isna()
+    counts = missing.sum()
+    counts = counts[counts > 0]
+    examples = []
+    for col in counts.index:
+        rows = missing[col]
+        examples.append({
+            'column': col,
+            'count': int(counts[col]),
+            'cities': sorted(lepto_df.loc[rows, 'adm3_en'].dropna().astype(str).unique().tolist())[:MAX_EXAMPLES],
+            'years': sorted(int(year) for year in years[rows].dropna().unique())[:MAX_EXAMPLES],
+        })
+    message = ', '.join(f"{col}: {int(n)}" for col, n in counts.items())
+    return [_result('missing_values', counts.sum(), f"missing values ({message})", examples[:MAX_EXAMPLES])]
+
+
+def check_static(lepto_df, years):
+    # Groups where an attribute that should be constant takes several values:
+    # rows are sorted by group once and each group's min and max compared
+    offending = []
+    for keys, columns in STATIC_ATTRIBUTES:
+        columns = [col for col in columns if col in lepto_df.columns]
+        if not columns or lepto_df.empty:
+            continue
+        key_values = [years if key == 'year' else lepto_df[key] for key in keys]
+        codes = np.zeros(len(lepto_df), dtype=np.int64)
+        for values in key_values:
+            key_codes, uniques = pd.factorize(values)
+            codes = codes * (len(uniques) + 1) + key_codes + 1
+        order = np.argsort(codes, kind='stable')
+        starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+        values = lepto_df[columns].to_numpy(dtype=float)[order]
+        spread = np.maximum.reduceat(values, starts) - np.minimum.reduceat(values, starts)
+        groups, cols = np.nonzero(spread > 0)
+        first_rows = order[starts[groups]]
+        if len(groups):
+            offending.append(pd.DataFrame({
+                **{key: np.asarray(values_)[first_rows] for key, values_ in zip(keys, key_values)},
+                'column': np.array(columns, dtype=object)[cols],
+                'spread': spread[groups, cols],
+            }))
+    count = sum(len(frame) for frame in offending)
+    examples = [example for frame in offending for example in _examples(frame)][:MAX_EXAMPLES]
+    return [_result('non_unique_static', count, f"{count} city attributes with more than one value", examples)]
+
+
+def check_ranges(lepto_df):
+    # Values outside their plausible range (missing values are reported separately)
+    columns = [col for col in VALUE_RANGES if col in lepto_df.columns]
+    values = np.column_stack([
+        pd.to_numeric(lepto_df[col], errors='coerce').to_numpy(dtype=float) for col in columns
+    ]) if columns else np.empty((len(lepto_df), 0))
+    low = np.array([np.nan if VALUE_RANGES[col][0] is None else VALUE_RANGES[col][0] for col in columns])
+    high = np.array([np.nan if VALUE_RANGES[col][1] is None else VALUE_RANGES[col][1] for col in columns])
+    with np.errstate(invalid='ignore'):
+        bad = (values < low) | (values > high)
+    rows, cols = np.nonzero(bad)
+    offending = pd.DataFrame({
+        'row': lepto_df.index[rows],
+        'adm3_en': lepto_df['adm3_en'].to_numpy()[rows],
+        'date': lepto_df['date'].to_numpy()[rows],
+        'column': np.array(columns, dtype=object)[cols],
+        'value': values[rows, cols],
+    })
+    per_column = offending['column'].value_counts()
+    message = ', '.join(f"{col}: {n}" for col, n in per_column.items())
+    return [_result('out_of_range', len(offending), f"values out of range ({message})", _examples(offending))]
+
+
+def check_calendar(lepto_df, dates, last_weeks=None):
+    # Weekly calendar per city: dates off the 7-day grid, runs of absent weeks
+    # and weeks other cities report but this one lacks. With `last_weeks` (city ->
+    # latest week already stored) new rows are also checked against the stored data.
+    valid = dates.notna().to_numpy() & lepto_df['adm3_en'].notna().to_numpy()
+    cities = lepto_df['adm3_en'].astype(str).to_numpy()[valid]
+    week_values = dates.to_numpy(dtype='datetime64[ns]')[valid]
+    codes, names = pd.factorize(cities)
+    date_codes, calendar = pd.factorize(week_values, sort=True)
+
+    # Weeks of the shared calendar each city lacks
+    present = np.zeros((len(names), len(calendar)), dtype=bool)
+    present[codes, date_codes] = True
+    missing_per_city = len(calendar) - present.sum(axis=1)
+    lacking = pd.DataFrame({'adm3_en': names, 'missing_weeks': missing_per_city})
+    lacking = lacking[lacking['missing_weeks'] > 0].sort_values('missing_weeks', ascending=False)
+
+    if last_weeks is not None:
+        previous = pd.Series(last_weeks).reindex(names)
+        stored = previous.notna().to_numpy()
+        codes = np.concatenate([codes, np.nonzero(stored)[0]])
+        week_values = np.concatenate([week_values, previous[stored].to_numpy(dtype='datetime64[ns]')])
+
+    # Consecutive weeks of the same city
+    order = np.lexsort((week_values, codes))
+    codes, week_values = codes[order], week_values[order]
+    same_city = codes[1:] == codes[:-1]
+    step = week_values[1:] - week_values[:-1]
+    misaligned = same_city & (step % WEEK != np.timedelta64(0, 'ns'))
+    gap = same_city & ~misaligned & (step > WEEK)
+
+    def runs(mask, **extra):
+        return pd.DataFrame({
+            'adm3_en': names[codes[1:][mask]],
+            'after': pd.to_datetime(week_values[:-1][mask]),
+            'before': pd.to_datetime(week_values[1:][mask]),
+            **{key: value[mask] for key, value in extra.items()},
+        })
+
+    gaps = runs(gap, missing_weeks=(step // WEEK - 1).astype(int))
+    off_grid = runs(misaligned)
+    return [
+        _result('misaligned_weeks', len(off_grid), f"{len(off_grid)} dates off the weekly grid", _examples(off_grid)),
+        _result('missing_weeks', lacking['missing_weeks'].sum(),
+                f"{len(lacking)} cities lack {int(lacking['missing_weeks'].sum())} weeks other cities report",
+                _examples(lacking)),
+        _result('calendar_gaps', gaps['missing_weeks'].sum(),
+                f"{int(gaps['missing_weeks'].sum())} weeks absent in {len(gaps)} gaps of the weekly calendar",
+                _examples(gaps)),
+    ]
+
+
+def validate_table(lepto_df, last_weeks=None, source=None):
+    # Run every check over the table; returns the report as plain JSON values
+    start = time.perf_counter()
+    missing_columns = [col for col in KEY_COLUMNS if col not in lepto_df.columns]
+    if missing_columns:
+        raise ValueError(f"cannot validate a table without {missing_columns}")
+
+    dates = pd.to_datetime(lepto_df['date'], errors='coerce')
+    years = dates.dt.year
+    checks = (
+        check_duplicates(lepto_df)
+        + check_missing(lepto_df, years)
+        + check_static(lepto_df, years)
+        + check_ranges(lepto_df)
+        + check_calendar(lepto_df, dates, last_weeks)
+    )
+    failed = [check for check in checks if not check['passed']]
+    return {
+        'source': source,
+        'rows': len(lepto_df),
+        'cities': int(lepto_df['adm3_en'].nunique()),
+        'passed': not any(check['severity'] == 'error' for check in failed),
+        'errors': sum(check['severity'] == 'error' for check in failed),
+        'warnings': sum(check['severity'] == 'warning' for check in failed),
+        'seconds': round(time.perf_counter() - start, 4),
+        'checks': checks,
+    }
+
+
+def problems(report, severity='error'):
+    # One line per failed check of the given severity
+    return [check['message'] for check in report['checks'] if not check['passed'] and check['severity'] == severity]
+
+
+def validate_file(path=DATA_PATH):
+    # Validate a cleaned dataset at full CSV precision
+    return validate_table(read_lepto_table(path), source=path)
+
+
+def print_report(report):
+    status = 'passed' if report['passed'] else 'FAILED'
+    print(f"{report['source'] or 'table'}: {report['rows']} rows, {report['cities']} cities, {status} "
+          f"({report['errors']} errors, {report['warnings']} warnings) in {report['seconds'] * 1000:.1f} ms")
+    for check in report['checks']:
+        mark = 'ok' if check['passed'] else check['severity']
+        print(f"  {check['check']:<20}{mark:<9}{check['message']}")
+        for example in check['examples']:
+            print(f"  {'':<29}{example}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a cleaned LeptoShield dataset.")
+    parser.add_argument('path', nargs='?', default=DATA_PATH, help="path to lepto_dfclean.csv")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    parser.add_argument('--strict', action='store_true', help="also fail on warnings")
+    args = parser.parse_args()
+
+    report = validate_file(args.path)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    failed = not report['passed'] or (args.strict and report['warnings'])
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())